@@ -0,0 +1,285 @@
+"""
+Scraper benchmark against the local stand-in site
+
+    python -m benchmarks.run --pages 10 --repeat 3 --output bench.json
+    python -m benchmarks.run --output new.json --compare bench.json
+"""
+import argparse
+import asyncio
+import functools
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from benchmarks.server import StandInSite
+
+ENGINES = ("work_ua_http", "work_ua_selenium", "work_ua_selenium_full", "robota_ua")
+BROWSER_PROCESS_NAMES = ("msedge", "edge", "chrome", "chromium")
+FILTERS = {
+    "job_position": "python developer",
+    "location": "Київ",
+    "work_experience": "2-5 years",
+    "employment_type": "Full time",
+    "salary_from": 20000,
+    "salary_to": 50000,
+}
+
+
+def read_process_table() -> dict[int, tuple[int, str, int]]:
+    """
+    Returns pid -> (parent pid, process name, rss in bytes) for every process visible in /proc
+    """
+    processes = {}
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    for proc_dir in Path("/proc").glob("[0-9]*"):
+        try:
+            stat = (proc_dir / "stat").read_text()
+            statm = (proc_dir / "statm").read_text().split()
+        except OSError:
+            continue
+        # process name is in parentheses and may contain spaces
+        name = stat[stat.index("(") + 1:stat.rindex(")")]
+        parent_pid = int(stat[stat.rindex(")") + 2:].split()[1])
+        processes[int(proc_dir.name)] = (parent_pid, name, int(statm[1]) * page_size)
+    return processes
+
+
+def process_tree_usage() -> tuple[int, int]:
+    """
+    Returns rss of this process with all its descendants and number of browser processes among them
+    """
+    if not Path("/proc/self/stat").exists():
+        # no procfs, only own peak rss is known
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024, 0
+
+    processes = read_process_table()
+    tree, pending = set(), [os.getpid()]
+    while pending:
+        pid = pending.pop()
+        tree.add(pid)
+        pending.extend(child for child, (parent, _, _) in processes.items() if parent == pid and child not in tree)
+    rss = sum(processes[pid][2] for pid in tree if pid in processes)
+    browsers = sum(1 for pid in tree
+                   if pid in processes and any(name in processes[pid][1].lower() for name in BROWSER_PROCESS_NAMES))
+    return rss, browsers
+
+
+class ResourceSampler:
+    """
+    Samples memory and browser process count in the background while a benchmark runs
+    """
+
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.peak_rss = 0
+        self.max_browser_processes = 0
+        self._task = None
+
+    async def _sample(self) -> None:
+        while True:
+            rss, browsers = await asyncio.to_thread(process_tree_usage)
+            self.peak_rss = max(self.peak_rss, rss)
+            self.max_browser_processes = max(self.max_browser_processes, browsers)
+            await asyncio.sleep(self.interval)
+
+    async def __aenter__(self) -> "ResourceSampler":
+        self._task = asyncio.create_task(self._sample())
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class StageTimer:
+    def __init__(self) -> None:
+        self.samples: dict[str, list[float]] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.samples.setdefault(name, []).append(time.perf_counter() - started)
+
+    def summary(self) -> dict:
+        return {
+            name: {
+                "median": statistics.median(samples),
+                "min": min(samples),
+                "max": max(samples),
+                "samples": samples,
+            }
+            for name, samples in self.samples.items()
+        }
+
+
+def uncached_detail_fetcher():
+    from scraping.cache import MemoryCacheBackend, ResultCache
+    from scraping.details import DetailFetcher, detail_fetcher
+
+    # no politeness delay against the local site, every run loads the pages again
+    return DetailFetcher(ResultCache(MemoryCacheBackend(max_entries=0)), detail_fetcher.concurrency, delay=0)
+
+
+async def bench_work_ua_http(timer: StageTimer, limit: int) -> int:
+    from scraping.http_scrapers import WorkUaHttpScraper
+    from scraping.main import collect_resumes
+
+    parser = WorkUaHttpScraper()
+    with timer.stage("open_search"):
+        await parser.open_search(FILTERS)
+    with timer.stage("first_cards"):
+        first_cards = await collect_resumes(parser, limit)
+    with timer.stage("resume_details"):
+        await uncached_detail_fetcher().add_details(parser, first_cards["resume_cards"])
+    with timer.stage("parse_resumes"):
+        result = await WorkUaHttpScraper().parse_resumes(FILTERS)
+    return len(result["resume_cards"])
+
+
+async def bench_work_ua_selenium(timer: StageTimer, limit: int, profile: str = "lean") -> int:
+    from scraping.scrapers import WorkUaScraper
+
+    loop = asyncio.get_running_loop()
+    with timer.stage("init_driver"):
+        driver = await loop.run_in_executor(None, WorkUaScraper.init_driver, profile)
+    parser = WorkUaScraper(driver=driver)
+    try:
+        with timer.stage("navigate_to_results"):
+            await parser.navigate_to_results(filters=FILTERS)
+        # the form-driven path is still used for unknown cities
+        with timer.stage("find_resumes_without_filters"):
+            await parser.find_resumes_without_filters(filters=FILTERS)
+        with timer.stage("apply_filters"):
+            await parser.apply_filters(filters=FILTERS)
+        with timer.stage("parse_resumes"):
+            result = await parser.parse_resumes()
+    finally:
+        with timer.stage("close_driver"):
+            await loop.run_in_executor(None, driver.quit)
+    return len(result["resume_cards"])
+
+
+async def bench_robota_ua(timer: StageTimer, limit: int) -> int:
+    from scraping.http_scrapers import RobotaUaScraper
+    from scraping.main import collect_resumes
+
+    parser = RobotaUaScraper()
+    with timer.stage("open_search"):
+        await parser.open_search(FILTERS)
+    with timer.stage("first_cards"):
+        first_cards = await collect_resumes(parser, limit)
+    with timer.stage("resume_details"):
+        await uncached_detail_fetcher().add_details(parser, first_cards["resume_cards"])
+    with timer.stage("parse_resumes"):
+        result = await RobotaUaScraper().parse_resumes(FILTERS)
+    return len(result["resume_cards"])
+
+
+BENCHMARKS = {
+    "work_ua_http": bench_work_ua_http,
+    "work_ua_selenium": bench_work_ua_selenium,
+    # the same search in a browser that loads every asset, to compare with the lean profile
+    "work_ua_selenium_full": functools.partial(bench_work_ua_selenium, profile="full"),
+    "robota_ua": bench_robota_ua,
+}
+
+
+async def run_engine(engine: str, site: StandInSite, repeat: int, limit: int) -> dict:
+    timer = StageTimer()
+    cards = 0
+    requests_before = site.requests_served
+    async with ResourceSampler() as sampler:
+        for _ in range(repeat):
+            cards += await BENCHMARKS[engine](timer, limit)
+    parse_time = sum(timer.samples["parse_resumes"])
+    return {
+        "stages": timer.summary(),
+        "pages_per_sec": site.total_pages * repeat / parse_time,
+        "cards_per_sec": cards / parse_time,
+        "cards": cards // repeat,
+        "requests": (site.requests_served - requests_before) // repeat,
+        "peak_rss_mb": sampler.peak_rss / 2 ** 20,
+        "max_browser_processes": sampler.max_browser_processes,
+    }
+
+
+async def run(engines: list[str], pages: int, repeat: int, limit: int) -> dict:
+    site = StandInSite(total_pages=pages).start()
+    # scrapers read urls from the environment, so they have to point to the stand-in before import
+    os.environ.update(site.env())
+    results = {}
+    try:
+        for engine in engines:
+            print(f"Benchmarking {engine}...", file=sys.stderr)
+            results[engine] = await run_engine(engine, site, repeat, limit)
+    finally:
+        from scraping.http_client import http_client
+
+        await http_client.close()
+        site.stop()
+    return {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"pages": pages, "repeat": repeat, "limit": limit},
+        "results": results,
+    }
+
+
+def compare(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Prints stage medians next to the baseline ones, returns stages that got slower than `threshold` percent
+    """
+    regressions = []
+    for engine, result in report["results"].items():
+        baseline_result = baseline["results"].get(engine)
+        if baseline_result is None:
+            continue
+        for stage, timing in result["stages"].items():
+            baseline_timing = baseline_result["stages"].get(stage)
+            if baseline_timing is None:
+                continue
+            change = (timing["median"] / baseline_timing["median"] - 1) * 100
+            print(f"{engine:18} {stage:30} {baseline_timing['median']:8.3f}s -> {timing['median']:8.3f}s "
+                  f"{change:+7.1f}%")
+            if change > threshold:
+                regressions.append(f"{engine}.{stage}")
+        for metric in ("peak_rss_mb", "max_browser_processes"):
+            print(f"{engine:18} {metric:30} {baseline_result[metric]:9.1f} -> {result[metric]:9.1f}")
+    return regressions
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Benchmark scrapers against a local stand-in site")
+    arg_parser.add_argument("--engines", nargs="+", choices=ENGINES, default=list(ENGINES))
+    arg_parser.add_argument("--pages", type=int, default=10, help="result pages served per search")
+    arg_parser.add_argument("--repeat", type=int, default=3)
+    arg_parser.add_argument("--limit", type=int, default=5, help="cards taken in the first_cards stage")
+    arg_parser.add_argument("--output", help="file to write JSON report to, stdout by default")
+    arg_parser.add_argument("--compare", help="JSON report of a previous run to compare with")
+    arg_parser.add_argument("--threshold", type=float, default=10.0,
+                            help="slowdown in percent that is reported as a regression")
+    args = arg_parser.parse_args()
+
+    report = asyncio.run(run(args.engines, args.pages, args.repeat, args.limit))
+    report_json = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(report_json)
+    else:
+        print(report_json)
+
+    if args.compare:
+        regressions = compare(report, json.loads(Path(args.compare).read_text()), args.threshold)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures"
+CARDS_PER_PAGE = 14
+# sizes of fake static assets, so browsers download roughly what a real page costs
+STATIC_ASSET_SIZES = {
+    ".css": 150_000,
+    ".js": 250_000,
+    ".jpg": 400_000,
+}
+STATIC_CONTENT_TYPES = {
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".jpg": "image/jpeg",
+}
+
+
+class StandInSite:
+    """
+    Local stand-in for work.ua and robota.ua serving recorded pages, so scrapers can be
+    benchmarked without hitting the live sites
+    """
+
+    def __init__(self, total_pages: int = 10, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.total_pages = total_pages
+        self.requests_served = 0
+        self.work_ua_home = (FIXTURES_DIR / "work_ua" / "home.html").read_text(encoding="utf-8")
+        self.work_ua_results = (FIXTURES_DIR / "work_ua" / "results.html").read_text(encoding="utf-8")
+        self.work_ua_resume = (FIXTURES_DIR / "work_ua" / "resume.html").read_bytes()
+        self.robota_ua_resumes = json.loads((FIXTURES_DIR / "robota_ua" / "resumes.json").read_text(encoding="utf-8"))
+        self.robota_ua_cities = (FIXTURES_DIR / "robota_ua" / "cities.json").read_bytes()
+        self.robota_ua_resume = (FIXTURES_DIR / "robota_ua" / "resume.json").read_bytes()
+        self.server = ThreadingHTTPServer((host, port), self.make_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def env(self) -> dict:
+        """
+        Environment variables that point the scrapers to the stand-in site
+        """
+        return {
+            "WORK_UA_BASE_URL": f"{self.url}/resumes/?ss=1",
+            "ROBOTA_UA_BASE_URL": f"{self.url}/candidates/all/ukraine",
+            "ROBOTA_UA_API_URL": f"{self.url}/cvdb/resumes",
+            "ROBOTA_UA_CITIES_URL": f"{self.url}/dictionary/city",
+            "ROBOTA_UA_RESUME_API_URL": f"{self.url}/resume",
+            # both stand-in sites share one host, the benchmark measures the scrapers, not the rate limit
+            "SITE_RATE_LIMIT": "1000",
+            "SITE_BURST": "1000",
+        }
+
+    def start(self) -> "StandInSite":
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def work_ua_results_page(self, page: int) -> bytes:
+        html = (self.work_ua_results
+                .replace("{last_page}", str(self.total_pages))
+                .replace("{total}", str(self.total_pages * CARDS_PER_PAGE)))
+        # every page has its own resume links, like on the real site
+        html = re.sub(r'href="/resumes/(\d+)/"', lambda match: f'href="/resumes/{page}{match.group(1)}/"', html)
+        return html.encode("utf-8")
+
+    def robota_ua_results_page(self, page: int) -> bytes:
+        documents = [
+            {**document, "resumeId": int(f"{page + 1}{document['resumeId']}")}
+            for document in self.robota_ua_resumes["documents"]
+        ]
+        total = self.total_pages * len(documents)
+        return json.dumps({"documents": documents if page < self.total_pages else [], "total": total}).encode("utf-8")
+
+    def make_handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):  # noqa: N802 name is defined by BaseHTTPRequestHandler
+                url = urlsplit(self.path)
+                suffix = Path(url.path).suffix
+                if url.path.startswith("/static/") and suffix in STATIC_ASSET_SIZES:
+                    self.respond(b"/" * STATIC_ASSET_SIZES[suffix], STATIC_CONTENT_TYPES[suffix])
+                elif url.path == "/resumes/":
+                    self.respond(site.work_ua_home.encode("utf-8"))
+                elif url.path.startswith("/resumes-"):
+                    page = int(parse_qs(url.query).get("page", ["1"])[-1])
+                    self.respond(site.work_ua_results_page(page))
+                elif re.fullmatch(r"/resumes/\d+/", url.path):
+                    self.respond(site.work_ua_resume)
+                elif re.fullmatch(r"/resume/\d+", url.path):
+                    self.respond(site.robota_ua_resume, "application/json")
+                elif url.path == "/dictionary/city":
+                    self.respond(site.robota_ua_cities, "application/json")
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):  # noqa: N802 name is defined by BaseHTTPRequestHandler
+                if urlsplit(self.path).path != "/cvdb/resumes":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                self.respond(site.robota_ua_results_page(int(body.get("page", 0))), "application/json")
+
+            def respond(self, body: bytes, content_type: str = "text/html; charset=utf-8"):
+                site.requests_served += 1
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):  # noqa: VNE003 signature of BaseHTTPRequestHandler
+                pass
+
+        return Handler
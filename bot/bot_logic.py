@@ -1,17 +1,36 @@
 import asyncio
 import logging
+import os
 import sys
 
 from aiogram import Dispatcher, types
 from aiogram.filters import Command, CommandStart
 from aiogram.fsm.context import FSMContext
 from aiogram.types import KeyboardButton, ReplyKeyboardMarkup
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
 
 from bot import bot
 from bot.parse_resumes import search_router
 from bot.states import Navigation
+from bot.storage import fsm_storage
+from bot.utils import adopt_orphaned_searches
+from bot.watch import start_watching, watch_router
+from scraping.driver_pool import driver_pool
+from scraping.http_client import http_client
+from scraping.jobs import job_queue
+from scraping.metrics import metrics_exporter
+from scraping.watch import watch_scheduler
 
-dp = Dispatcher()
+# public https url Telegram sends updates to, the bot polls for updates when it is empty
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8080))
+
+dp = Dispatcher(storage=fsm_storage)
+background_tasks = set()
 
 
 @dp.message(CommandStart())
@@ -33,11 +52,61 @@ async def main_menu(message: types.Message):
     await message.answer("Choose an option:", reply_markup=keyboard)
 
 
-async def main() -> None:
+async def start_adopting_searches():
+    background_tasks.add(asyncio.create_task(adopt_orphaned_searches()))
+
+
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
+
+
+async def set_webhook():
+    await bot.set_webhook(WEBHOOK_URL, secret_token=WEBHOOK_SECRET, drop_pending_updates=False)
+
+
+def setup_dispatcher() -> Dispatcher:
+    # saved search buttons may be pressed in the middle of another search
+    dp.include_router(watch_router)
     dp.include_router(search_router)
-    await dp.start_polling(bot)
+    # warm browser sessions before the first search arrives
+    dp.startup.register(driver_pool.start)
+    dp.startup.register(job_queue.start)
+    dp.startup.register(metrics_exporter.start)
+    dp.startup.register(start_watching)
+    dp.startup.register(start_adopting_searches)
+    dp.shutdown.register(stop_background_tasks)
+    dp.shutdown.register(watch_scheduler.close)
+    dp.shutdown.register(metrics_exporter.close)
+    dp.shutdown.register(job_queue.close)
+    dp.shutdown.register(driver_pool.close)
+    dp.shutdown.register(http_client.close)
+    return dp
+
+
+async def main() -> None:
+    # updates can't be polled while a webhook from an earlier run is set
+    await bot.delete_webhook()
+    await setup_dispatcher().start_polling(bot)
+
+
+def run_webhook() -> None:
+    """
+    Serves updates pushed by Telegram, several processes can run behind one load balancer
+    when they share FSM storage, job queue and result cursors
+    """
+    setup_dispatcher().startup.register(set_webhook)
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=WEBHOOK_SECRET).register(app, path=WEBHOOK_PATH)
+    setup_application(app, dp, bot=bot)
+    web.run_app(app, host=WEBHOOK_HOST, port=WEBHOOK_PORT)
 
 
 if __name__ == "__main__":
     logging.basicConfig(level=logging.INFO, stream=sys.stdout)
-    asyncio.run(main())
+    if WEBHOOK_URL:
+        run_webhook()
+    else:
+        asyncio.run(main())
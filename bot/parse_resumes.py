@@ -5,18 +5,50 @@ from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 from bot import bot, utils
 from bot.states import Form, Navigation
 from scraping import main, scrapers
+from scraping.cursors import result_cursors
+from scraping.jobs import JobQueueFullError, UserJobLimitError, job_queue
+from scraping.metrics import metrics
 
 search_router = Router()
 
-PARSERS = {
-    "work.ua": scrapers.WorkUaScraper,
-    "robota.ua": scrapers.RobotaUaScraper,
-}
+PARSERS = main.PARSER_CLASSES
+ALL_SITES = "All sites"
+
+
+def get_parser_class(job_site: str):
+    """
+    Returns scraper class of the site, "all sites" search uses work.ua options for filters
+    """
+    if job_site == ALL_SITES:
+        return scrapers.WorkUaScraper
+    return PARSERS.get(job_site)
+
+
+@search_router.callback_query(lambda callback_query: callback_query.data.startswith("page:"))
+async def show_results_page(callback_query: types.CallbackQuery):
+    _, cursor_id, page = callback_query.data.split(":")
+    cursor = await result_cursors.get(cursor_id)
+    if cursor is None or cursor.user_id != callback_query.from_user.id:
+        await callback_query.answer("These results have expired, please run the search again")
+        return
+    await utils.show_results_page(callback_query=callback_query, cursor=cursor, page=int(page))
+    await callback_query.answer()
+
+
+# a search may be cancelled while a new search form is filled in, so this goes before the form states
+@search_router.callback_query(lambda callback_query: callback_query.data.startswith("cancel_search:"))
+async def cancel_search(callback_query: types.CallbackQuery):
+    job_id = int(callback_query.data.split(":")[1])
+    job = await job_queue.get(job_id)
+    if job and job.user_id == callback_query.from_user.id and await job_queue.cancel(job_id):
+        await callback_query.answer("Search cancelled")
+    else:
+        await callback_query.answer("Search is already finished")
 
 
 @search_router.message(lambda message: message.text == "Start Searching for Resumes")
 async def start_process(message: types.Message, state: FSMContext):
-    job_site_keyboard = utils.create_formatted_inline_keyboard(["work.ua", "robota.ua"])
+    job_site_keyboard = utils.create_formatted_inline_keyboard([*PARSERS.keys(), ALL_SITES])
 
     bot_message = await message.answer("Choose a job site:", reply_markup=job_site_keyboard)
     await state.update_data(bot_message_id=bot_message.message_id)
@@ -50,7 +82,7 @@ async def process_occupation(message: types.Message, state: FSMContext):
 async def process_location(message: types.Message, state: FSMContext):
     await state.update_data(location=message.text)
     state_memo = await state.get_data()
-    parser_class = PARSERS.get(state_memo.get("job_site"))
+    parser_class = get_parser_class(state_memo.get("job_site"))
 
     experience_keyboard = utils.create_formatted_inline_keyboard(parser_class.work_experience.keys())
 
@@ -67,7 +99,7 @@ async def process_location(message: types.Message, state: FSMContext):
 async def process_experience(callback_query: types.CallbackQuery, state: FSMContext):
     await state.update_data(work_experience=callback_query.data)
     state_memo = await state.get_data()
-    parser_class = PARSERS.get(state_memo.get("job_site"))
+    parser_class = get_parser_class(state_memo.get("job_site"))
     employment_type_keyboard = utils.create_formatted_inline_keyboard(parser_class.employment_type.keys())
 
     await callback_query.message.edit_text(
@@ -81,7 +113,7 @@ async def process_experience(callback_query: types.CallbackQuery, state: FSMCont
 async def process_employment_type(callback_query: types.CallbackQuery, state: FSMContext):
     await state.update_data(employment_type=callback_query.data)
     state_memo = await state.get_data()
-    parser_class = PARSERS.get(state_memo.get("job_site"))
+    parser_class = get_parser_class(state_memo.get("job_site"))
     salaries = [str(salary) for salary in parser_class.salaries.keys()]
     salary_from_keyboard = utils.create_formatted_inline_keyboard(salaries)
 
@@ -96,7 +128,7 @@ async def process_employment_type(callback_query: types.CallbackQuery, state: FS
 async def process_salary_from(callback_query: types.CallbackQuery, state: FSMContext):
     await state.update_data(salary_from=int(callback_query.data))
     state_memo = await state.get_data()
-    parser_class = PARSERS.get(state_memo.get("job_site"))
+    parser_class = get_parser_class(state_memo.get("job_site"))
 
     salaries = [str(salary) for salary in list(parser_class.salaries.keys())[1:]]
     salary_to_keyboard = utils.create_formatted_inline_keyboard(salaries)
@@ -116,7 +148,8 @@ async def find_resumes(callback_query: types.CallbackQuery, state: FSMContext):
         [
             InlineKeyboardButton(text="Confirm operation", callback_data="confirm_operation"),
             InlineKeyboardButton(text="Cancel operation", callback_data="cancel_operation"),
-        ]
+        ],
+        [InlineKeyboardButton(text="Confirm with resume details", callback_data="confirm_operation_details")],
     ], )
 
     await callback_query.message.edit_text(
@@ -137,7 +170,7 @@ async def find_resumes(callback_query: types.CallbackQuery, state: FSMContext):
 @search_router.callback_query(Form.confirm_operation)
 async def confirm_and_execute_operation(callback_query: types.CallbackQuery, state: FSMContext):
     callback_data = callback_query.data
-    if callback_data == "confirm_operation":
+    if callback_data in ("confirm_operation", "confirm_operation_details"):
         state_memo = await state.get_data()
         filters = {
             "job_position": state_memo.get("job_position"),
@@ -147,15 +180,28 @@ async def confirm_and_execute_operation(callback_query: types.CallbackQuery, sta
             "salary_from": state_memo.get("salary_from"),
             "salary_to": state_memo.get("salary_to"),
         }
-        parser_class = PARSERS.get(state_memo.get("job_site"))
-        list_of_resumes, total_resume_count, warning = await main.parse_resumes(filters=filters,
-                                                                                parser_class=parser_class)
-        await utils.send_message_with_resumes(
-            callback_query=callback_query,
-            list_of_dicts=list_of_resumes,
-            total_resume_count=total_resume_count,
-            warning=warning
-        )
+        # resume pages are opened only when asked for, it is one more request per shown resume
+        details = callback_data == "confirm_operation_details"
+        # progress is shown in the confirmation message, any bot process can take it over from there.
+        # The search is kept with its results for "Watch this search" under them
+        meta = {"chat_id": callback_query.message.chat.id, "message_id": callback_query.message.message_id,
+                "search": {"job_site": state_memo.get("job_site"), "filters": filters}}
+        try:
+            if state_memo.get("job_site") == ALL_SITES:
+                job = await job_queue.submit(callback_query.from_user.id, main.parse_resumes_all_sites, meta=meta,
+                                             filters=filters, parser_classes=list(PARSERS.values()), details=details)
+            else:
+                job = await job_queue.submit(callback_query.from_user.id, main.parse_resumes, meta=meta,
+                                             filters=filters, parser_class=PARSERS.get(state_memo.get("job_site")),
+                                             details=details)
+        except (JobQueueFullError, UserJobLimitError) as error:
+            await callback_query.message.answer(text=str(error))
+        else:
+            # the search runs in the job queue, the conversation can go on meanwhile
+            await state.set_state(Navigation.main_menu)
+            with metrics.span("bot_search", site=state_memo.get("job_site")):
+                await utils.track_search_progress(job=job)
+            return
 
     await state.set_state(Navigation.main_menu)
     # TODO: main menu doesn't work, maybe the problem is in router
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+from typing import Any
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def storage_key_id(key: StorageKey) -> str:
+    """
+    Same conversation gets the same id in every bot process
+    """
+    parts = [key.bot_id, key.chat_id, key.user_id, key.thread_id, getattr(key, "business_connection_id", None),
+             key.destiny]
+    return ":".join("" if part is None else str(part) for part in parts)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM storage in a sqlite file, conversations survive restarts and are shared by bot processes of the host
+    """
+
+    def __init__(self, path: str) -> None:
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fsm ("
+            "key TEXT PRIMARY KEY, state TEXT, data TEXT NOT NULL DEFAULT '{}'"
+            ") WITHOUT ROWID"
+        )
+        self._connection.commit()
+
+    def _set_state(self, key: str, state: str | None) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO fsm (key, state) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET state = excluded.state",
+                (key, state),
+            )
+
+    def _set_data(self, key: str, data: str) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO fsm (key, data) VALUES (?, ?) ON CONFLICT (key) DO UPDATE SET data = excluded.data",
+                (key, data),
+            )
+
+    def _get(self, key: str) -> tuple[str | None, str]:
+        with self._lock:
+            row = self._connection.execute("SELECT state, data FROM fsm WHERE key = ?", (key,)).fetchone()
+        return row or (None, "{}")
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        state_name = state.state if isinstance(state, State) else state
+        await asyncio.to_thread(self._set_state, storage_key_id(key), state_name)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state, _ = await asyncio.to_thread(self._get, storage_key_id(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: dict[str, Any]) -> None:
+        await asyncio.to_thread(self._set_data, storage_key_id(key), json.dumps(data, ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        _, data = await asyncio.to_thread(self._get, storage_key_id(key))
+        return json.loads(data)
+
+    async def close(self) -> None:
+        await asyncio.to_thread(self._connection.close)
+
+
+def create_storage(url: str | None) -> BaseStorage:
+    """
+    FSM storage from FSM_STORAGE_URL: empty for memory, "sqlite:///path/to/file.db" or "redis://host:port/db"
+    """
+    if not url or url == "memory://":
+        return MemoryStorage()
+    if url.startswith("sqlite:///"):
+        return SQLiteStorage(url.removeprefix("sqlite:///"))
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        # redis is needed only for this storage, the bot runs without it otherwise
+        from aiogram.fsm.storage.redis import RedisStorage
+
+        return RedisStorage.from_url(url)
+    raise ValueError(f"Unsupported FSM storage {url}, use sqlite:///<path> or redis://<host>")
+
+
+fsm_storage = create_storage(os.getenv("FSM_STORAGE_URL"))
@@ -1,31 +1,164 @@
+import asyncio
+import logging
+
 from aiogram import types
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from bot import bot
+from scraping.cursors import ResultCursor, result_cursors
+from scraping.driver_pool import DriverPoolTimeoutError
+from scraping.jobs import JobStatus, job_queue
 from scraping.main import RESUME_DISPLAY_COUNT
+from scraping.metrics import metrics
+
+logger = logging.getLogger(__name__)
 
+# seconds between progress message updates, keeps us below Telegram edit limits
+SEARCH_PROGRESS_INTERVAL = 2
 
-async def send_message_with_resumes(callback_query: types.CallbackQuery,
-                                    list_of_dicts,
-                                    total_resume_count,
-                                    warning=None):
+
+def format_resumes(resume_cards) -> str:
     resumes = ""
-    for resume_dict in list_of_dicts[:RESUME_DISPLAY_COUNT]:  # Limit the number of resumes displayed
-        for link, info in resume_dict.items():
-            resumes += (f"Кандидат: *{info.get('candidate_name')}*\n"
-                        f"Occupation: *{info.get('candidate_occupation')}*\n"
-                        f"Link: {link}\n\n")
-
-    total_text = (f"*Found {total_resume_count} resumes*\n"
-                  f"*Shown {RESUME_DISPLAY_COUNT}*\n\n\n") + resumes
-    if warning:
-        total_text += f"\n\n*{warning}*"
-
-    print(total_text)
-
-    await callback_query.message.answer(
-        text=total_text,
-        parse_mode="Markdown",
-    )
+    for resume_card in resume_cards:
+        resumes += (f"Кандидат: *{resume_card.candidate_name}*\n"
+                    f"Occupation: *{resume_card.candidate_occupation}*\n")
+        if resume_card.details:
+            resumes += format_resume_details(resume_card.details)
+        resumes += f"Link: {resume_card.link}\n\n"
+    return resumes
+
+
+def format_resume_details(details: dict) -> str:
+    text = ""
+    if details.get("salary_expectation"):
+        text += f"Salary expectation: {details['salary_expectation']}\n"
+    if details.get("skills"):
+        text += f"Skills: {', '.join(details['skills'][:10])}\n"
+    for experience in details.get("experience", [])[:3]:
+        place = " ".join(filter(None, (experience.get("company"), experience.get("period"))))
+        text += f"Experience: {experience.get('position')}, {place}\n"
+    if details.get("updated_at"):
+        text += f"Updated: {details['updated_at']}\n"
+    return text
+
+
+def results_page_text(cursor: ResultCursor, page: int) -> str:
+    rows = cursor.page(page, RESUME_DISPLAY_COUNT)
+    first_shown = page * RESUME_DISPLAY_COUNT + 1
+    shown = f"{first_shown}-{first_shown + len(rows) - 1} of {len(cursor.resumes)}" if rows else "0"
+    total_text = (f"*Found {cursor.total_resumes} resumes*\n"
+                  f"*Shown {shown}*\n\n\n") + format_resumes(rows)
+    if cursor.warning:
+        total_text += f"\n\n*{cursor.warning}*"
+    return total_text
+
+
+def results_keyboard(cursor: ResultCursor, page: int) -> InlineKeyboardMarkup:
+    page_buttons = []
+    if page > 0:
+        page_buttons.append(InlineKeyboardButton(text="« Prev", callback_data=f"page:{cursor.cursor_id}:{page - 1}"))
+    if page + 1 < cursor.page_count(RESUME_DISPLAY_COUNT):
+        page_buttons.append(InlineKeyboardButton(text="Next »", callback_data=f"page:{cursor.cursor_id}:{page + 1}"))
+    return InlineKeyboardMarkup(inline_keyboard=[
+        page_buttons,
+        [InlineKeyboardButton(text="Watch this search", callback_data=f"watch_search:{cursor.cursor_id}")],
+    ], )
+
+
+async def send_message_with_resumes(chat_id: int, cursor: ResultCursor):
+    with metrics.span("telegram_delivery"):
+        await bot.send_message(
+            chat_id=chat_id,
+            text=results_page_text(cursor, page=0),
+            parse_mode="Markdown",
+            reply_markup=results_keyboard(cursor, page=0),
+        )
+
+
+async def show_results_page(callback_query: types.CallbackQuery, cursor: ResultCursor, page: int):
+    """
+    Replaces the shown results with another page of the same search
+    """
+    with metrics.span("telegram_delivery"):
+        await callback_query.message.edit_text(
+            text=results_page_text(cursor, page),
+            parse_mode="Markdown",
+            reply_markup=results_keyboard(cursor, page),
+        )
+
+
+def search_progress_text(job, position: int) -> str:
+    if job.status == JobStatus.QUEUED:
+        return f"Search is queued, {position} searches ahead of yours..."
+    if job.total_pages:
+        return f"Searching... page {job.page}/{job.total_pages}"
+    return "Searching..."
+
+
+async def track_search_progress(job):
+    """
+    Keeps the message from `job.meta` updated with the job progress and sends resumes when the job is done
+    """
+    chat_id, message_id = job.meta["chat_id"], job.meta["message_id"]
+
+    async def edit_message(text: str, reply_markup=None):
+        # the progress message is cosmetic, a failed edit must not stop the results from being sent
+        try:
+            await bot.edit_message_text(text=text, chat_id=chat_id, message_id=message_id, reply_markup=reply_markup)
+        except TelegramRetryAfter as error:
+            await asyncio.sleep(error.retry_after)
+            await edit_message(text, reply_markup)
+        except TelegramBadRequest as error:
+            # an adopted search repeats the text left by the previous process, Telegram rejects the same text
+            if "message is not modified" not in str(error):
+                logger.warning("Could not update progress of search %s: %s", job.job_id, error)
+
+    cancel_keyboard = InlineKeyboardMarkup(inline_keyboard=[
+        [InlineKeyboardButton(text="Cancel search", callback_data=f"cancel_search:{job.job_id}")]
+    ], )
+    progress_text = None
+    while not job.finished:
+        position = await job_queue.position(job.job_id) if job.status == JobStatus.QUEUED else 0
+        if search_progress_text(job, position) != progress_text:
+            progress_text = search_progress_text(job, position)
+            await edit_message(progress_text, reply_markup=cancel_keyboard)
+        try:
+            await job_queue.wait(job.job_id, SEARCH_PROGRESS_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+    if job.status == JobStatus.DONE:
+        await edit_message("Search finished")
+        list_of_resumes, total_resume_count, warning = job.result
+        # all collected cards are kept for paging, the search isn't run again for the next page
+        cursor = await result_cursors.create(job.user_id, list_of_resumes, total_resume_count, warning,
+                                             job.meta.get("search"))
+        await send_message_with_resumes(chat_id=chat_id, cursor=cursor)
+    elif job.status == JobStatus.CANCELLED:
+        await edit_message("Search cancelled")
+    elif isinstance(job.error, DriverPoolTimeoutError):
+        await edit_message(str(job.error))
+    else:
+        logger.error("Search %s failed: %r", job.job_id, job.error)
+        await edit_message("Search failed, please try again later")
+    await job_queue.mark_delivered(job.job_id)
+
+
+async def adopt_orphaned_searches():
+    """
+    Takes over progress and results of searches whose bot process is gone, only a shared job queue has them
+    """
+    trackers = set()
+    while job_queue.store:
+        for job in await job_queue.adopt_jobs():
+            if "chat_id" not in job.meta:
+                await job_queue.mark_delivered(job.job_id)
+                continue
+            tracker = asyncio.create_task(track_search_progress(job))
+            trackers.add(tracker)
+            tracker.add_done_callback(trackers.discard)
+        await asyncio.sleep(job_queue.store.stale_after)
 
 
 def chunk_list(lst, chunk_size):
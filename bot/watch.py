@@ -0,0 +1,83 @@
+import asyncio
+import os
+
+from aiogram import Router, types
+from aiogram.filters import Command
+from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
+
+from bot import bot, utils
+from bot.parse_resumes import ALL_SITES, PARSERS
+from scraping.cursors import result_cursors
+from scraping.records import Resume
+from scraping.watch import SavedSearch, watch_scheduler, watch_store
+
+watch_router = Router()
+
+WATCHES_PER_USER = int(os.getenv("WATCHES_PER_USER", 5))
+
+
+def describe_search(saved_search: SavedSearch) -> str:
+    filters = saved_search.filters
+    return (f"{', '.join(saved_search.sites)}: {filters.get('job_position')}, {filters.get('location')}, "
+            f"{filters.get('work_experience')}, {filters.get('salary_from')}-{filters.get('salary_to')}")
+
+
+@watch_router.callback_query(lambda callback_query: callback_query.data.split(":")[0] == "watch_search")
+async def watch_search(callback_query: types.CallbackQuery):
+    # the search is taken from the results the button is under, not from the user's latest search
+    _, _, cursor_id = callback_query.data.partition(":")
+    cursor = await result_cursors.get(cursor_id) if cursor_id else None
+    user_id = callback_query.from_user.id
+    if cursor is None or cursor.search is None or cursor.user_id != user_id:
+        await callback_query.answer("Search is too old, please run it again")
+        return
+
+    job_site, filters = cursor.search["job_site"], cursor.search["filters"]
+    sites = list(PARSERS) if job_site == ALL_SITES else [job_site]
+    saved_searches = await asyncio.to_thread(watch_store.list_searches, user_id)
+    if any(saved_search.sites == sites and saved_search.filters == filters for saved_search in saved_searches):
+        await callback_query.answer("You already watch this search")
+        return
+    if len(saved_searches) >= WATCHES_PER_USER:
+        await callback_query.answer(f"You can watch up to {WATCHES_PER_USER} searches, remove one with /watches")
+        return
+
+    await asyncio.to_thread(watch_store.add_search, user_id, callback_query.message.chat.id, sites, filters)
+    await callback_query.answer()
+    await callback_query.message.answer("I'll check this search regularly and send you only new resumes. "
+                                        "Use /watches to see your saved searches.")
+
+
+@watch_router.message(Command("watches"))
+async def list_watches(message: types.Message):
+    saved_searches = await asyncio.to_thread(watch_store.list_searches, message.from_user.id)
+    if not saved_searches:
+        await message.answer("You don't watch any searches yet")
+        return
+
+    text = "\n".join(f"{number}. {describe_search(saved_search)}"
+                     for number, saved_search in enumerate(saved_searches, start=1))
+    buttons = [
+        InlineKeyboardButton(text=f"Unwatch {number}", callback_data=f"unwatch:{saved_search.search_id}")
+        for number, saved_search in enumerate(saved_searches, start=1)
+    ]
+    await message.answer(text, reply_markup=InlineKeyboardMarkup(inline_keyboard=list(utils.chunk_list(buttons, 4))))
+
+
+@watch_router.callback_query(lambda callback_query: callback_query.data.startswith("unwatch:"))
+async def unwatch_search(callback_query: types.CallbackQuery):
+    search_id = int(callback_query.data.split(":")[1])
+    if await asyncio.to_thread(watch_store.delete_search, search_id, callback_query.from_user.id):
+        await callback_query.answer("Search removed")
+    else:
+        await callback_query.answer("Search is already removed")
+
+
+async def send_new_resumes(saved_search: SavedSearch, resume_cards: list[Resume]):
+    text = f"*New resumes for your saved search*\n{describe_search(saved_search)}\n\n\n"
+    text += utils.format_resumes(resume_cards)
+    await bot.send_message(chat_id=saved_search.chat_id, text=text, parse_mode="Markdown")
+
+
+async def start_watching():
+    await watch_scheduler.start(parser_classes=PARSERS, notify=send_new_resumes)
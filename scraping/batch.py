@@ -0,0 +1,258 @@
+"""
+Batch search outside the bot, runs every filter set of a file and streams results as searches complete
+
+    python -m scraping.batch searches.jsonl --output results.jsonl
+    python -m scraping.batch searches.csv --output results.csv --workers 8 --limit 20
+
+Filter sets use the bot's filter names and an optional "sites" list, all sites are searched by default.
+A list instead of a single filter value makes one search per value, so
+{"job_position": ["python", "java"], "location": ["Київ", "Львів"]} is 4 searches on every site
+"""
+import argparse
+import asyncio
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+from scraping.cache import make_cache_key
+from scraping.driver_pool import driver_pool
+from scraping.http_client import http_client
+from scraping.jobs import JobQueue, JobStatus
+from scraping.main import PARSER_CLASSES, RESUME_DISPLAY_COUNT, parse_resumes
+from scraping.metrics import metrics
+from scraping.records import RESUME_FIELDS, Resume
+
+load_dotenv()
+
+BATCH_WORKERS = int(os.getenv("BATCH_WORKERS", 4))
+FILTER_NAMES = ("job_position", "location", "work_experience", "employment_type", "salary_from", "salary_to")
+# the batch is a single "user" of its own job queue
+BATCH_USER_ID = 0
+
+
+@dataclass
+class BatchSearch:
+    site: str
+    filters: dict
+    # numbers of the filter sets that asked for this search, the same search is run only once
+    sources: list[int] = field(default_factory=list)
+
+
+@dataclass
+class BatchStats:
+    filter_sets: int = 0
+    searches: int = 0
+    unique_searches: int = 0
+    done: int = 0
+    failed: int = 0
+    resumes: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    def summary(self) -> dict:
+        elapsed = time.monotonic() - self.started_at
+        return {
+            "filter_sets": self.filter_sets,
+            "searches": self.searches,
+            "unique_searches": self.unique_searches,
+            "done": self.done,
+            "failed": self.failed,
+            "resumes": self.resumes,
+            "elapsed_sec": round(elapsed, 2),
+            "searches_per_min": round((self.done + self.failed) / elapsed * 60, 2) if elapsed else 0,
+            "resumes_per_sec": round(self.resumes / elapsed, 2) if elapsed else 0,
+        }
+
+
+def parse_filter_value(name: str, value):
+    """
+    CSV cells are strings, salaries are numbers in the scrapers' tables
+    """
+    if value in (None, ""):
+        return None
+    if name in ("salary_from", "salary_to") and isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return value
+
+
+def load_filter_sets(path: str) -> list[dict]:
+    """
+    Reads filter sets from a JSON Lines, JSON list or CSV file
+    """
+    text = Path(path).read_text(encoding="utf-8")
+    if path.endswith(".csv"):
+        return [dict(row) for row in csv.DictReader(text.splitlines())]
+    if path.endswith(".json"):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def expand_filter_set(filter_set: dict) -> list[tuple[str, dict]]:
+    """
+    Returns (site, filters) of every search the filter set stands for
+    """
+    sites = filter_set.get("sites") or list(PARSER_CLASSES)
+    if isinstance(sites, str):
+        sites = [site.strip() for site in sites.split(",") if site.strip()]
+    unknown_sites = [site for site in sites if site not in PARSER_CLASSES]
+    if unknown_sites:
+        raise ValueError(f"Unknown sites {', '.join(unknown_sites)}, supported: {', '.join(PARSER_CLASSES)}")
+
+    values = [
+        [parse_filter_value(name, value) for value in filter_set[name]]
+        if isinstance(filter_set.get(name), list) else [parse_filter_value(name, filter_set.get(name))]
+        for name in FILTER_NAMES
+    ]
+    return [(site, dict(zip(FILTER_NAMES, combination)))
+            for site in sites
+            for combination in itertools.product(*values)]
+
+
+def plan_searches(filter_sets: list[dict], stats: BatchStats | None = None) -> list[BatchSearch]:
+    """
+    Expands filter sets into searches, searches that differ only in spelling of the same filters are run once
+    """
+    searches: dict[str, BatchSearch] = {}
+    total = 0
+    for number, filter_set in enumerate(filter_sets, start=1):
+        for site, filters in expand_filter_set(filter_set):
+            total += 1
+            key = make_cache_key(site, filters)
+            if key not in searches:
+                searches[key] = BatchSearch(site, filters)
+            searches[key].sources.append(number)
+    if stats is not None:
+        stats.filter_sets = len(filter_sets)
+        stats.searches = total
+        stats.unique_searches = len(searches)
+    return list(searches.values())
+
+
+async def iter_batch(searches: list[BatchSearch], workers: int = BATCH_WORKERS, limit: int = RESUME_DISPLAY_COUNT,
+                     details: bool = False):
+    """
+    Runs searches on `workers` workers sharing the browser pool and http connections,
+    yields (search, job) in the order they finish
+    """
+    if not searches:
+        return
+    queue = JobQueue(workers=workers, max_queued=len(searches), per_user_limit=len(searches))
+    await queue.start()
+    try:
+        jobs = {
+            (await queue.submit(BATCH_USER_ID, parse_resumes, PARSER_CLASSES[search.site], search.filters, limit,
+                                details)).job_id: search
+            for search in searches
+        }
+        for finished in asyncio.as_completed([queue.wait(job_id) for job_id in jobs]):
+            job = await finished
+            metrics.increment("batch_searches_total", status=job.status.value)
+            yield jobs[job.job_id], job
+    finally:
+        await queue.close()
+
+
+class JsonLinesWriter:
+    """
+    One line per search with its filters and found resumes
+    """
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+
+    def write(self, search: BatchSearch, resume_cards: list[Resume], total_resumes: int, warning: str | None) -> None:
+        self.stream.write(json.dumps({
+            "site": search.site,
+            "filters": search.filters,
+            "sources": search.sources,
+            "total_resumes": total_resumes,
+            "warning": warning,
+            "resumes": [asdict(resume_card) for resume_card in resume_cards],
+        }, ensure_ascii=False) + "\n")
+        self.stream.flush()
+
+
+class CsvWriter:
+    """
+    One row per resume, filters of the search are repeated in every row
+    """
+
+    def __init__(self, stream) -> None:
+        self.stream = stream
+        self.writer = csv.writer(stream)
+        self.writer.writerow(["site", *FILTER_NAMES, "total_resumes", "warning", *RESUME_FIELDS])
+
+    def write(self, search: BatchSearch, resume_cards: list[Resume], total_resumes: int, warning: str | None) -> None:
+        search_columns = [search.site, *(search.filters.get(name) for name in FILTER_NAMES), total_resumes, warning]
+        for resume_card in resume_cards:
+            row = resume_card.as_row()
+            if resume_card.details:
+                row[RESUME_FIELDS.index("details")] = json.dumps(resume_card.details, ensure_ascii=False)
+            self.writer.writerow([*search_columns, *row])
+        self.stream.flush()
+
+
+WRITERS = {
+    "jsonl": JsonLinesWriter,
+    "csv": CsvWriter,
+}
+
+
+async def run_batch(searches: list[BatchSearch], writer, stats: BatchStats, workers: int = BATCH_WORKERS,
+                    limit: int = RESUME_DISPLAY_COUNT, details: bool = False) -> BatchStats:
+    """
+    Writes the best `limit` resumes of every search with `writer` as soon as the search is done
+    """
+    async for search, job in iter_batch(searches, workers, limit, details):
+        if job.status == JobStatus.DONE:
+            resume_cards, total_resumes, warning = job.result
+            writer.write(search, resume_cards[:limit], total_resumes, warning)
+            stats.done += 1
+            stats.resumes += len(resume_cards[:limit])
+        else:
+            stats.failed += 1
+            print(f"Search {search.site} {search.filters} {job.status.value}: {job.error!r}", file=sys.stderr)
+        finished = stats.done + stats.failed
+        print(f"[{finished}/{stats.unique_searches}] {search.site} {search.filters.get('job_position')} "
+              f"{search.filters.get('location')}: {job.status.value}", file=sys.stderr)
+    return stats
+
+
+async def run_cli(args: argparse.Namespace) -> dict:
+    stats = BatchStats()
+    searches = plan_searches(load_filter_sets(args.input), stats)
+    output_format = args.format or ("csv" if (args.output or "").endswith(".csv") else "jsonl")
+    stream = open(args.output, "w", encoding="utf-8", newline="") if args.output else sys.stdout
+    try:
+        await run_batch(searches, WRITERS[output_format](stream), stats, args.workers, args.limit, args.details)
+    finally:
+        if stream is not sys.stdout:
+            stream.close()
+        await driver_pool.close()
+        await http_client.close()
+    return stats.summary()
+
+
+def main() -> None:
+    arg_parser = argparse.ArgumentParser(description="Run many resume searches from a file of filter sets")
+    arg_parser.add_argument("input", help="JSON Lines, JSON or CSV file with filter sets")
+    arg_parser.add_argument("--output", help="file to stream results to, stdout by default")
+    arg_parser.add_argument("--format", choices=WRITERS, help="output format, taken from the output file by default")
+    arg_parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="searches run at once")
+    arg_parser.add_argument("--limit", type=int, default=RESUME_DISPLAY_COUNT, help="best resumes written per search")
+    arg_parser.add_argument("--details", action="store_true", help="open resume pages for skills and experience")
+    args = arg_parser.parse_args()
+
+    summary = asyncio.run(run_cli(args))
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    sys.exit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
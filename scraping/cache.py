@@ -0,0 +1,199 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from scraping.cities import find_work_ua_city_slug, normalize_city_name
+from scraping.metrics import metrics
+
+load_dotenv()
+
+# seconds search results of the site stay fresh
+RESULT_CACHE_TTLS = {
+    "work.ua": int(os.getenv("WORK_UA_CACHE_TTL", 600)),
+    "robota.ua": int(os.getenv("ROBOTA_UA_CACHE_TTL", 600)),
+}
+DEFAULT_CACHE_TTL = 600
+# parsed resume pages are keyed by their last update time, so they may be kept for long
+DETAIL_CACHE_TTL = int(os.getenv("DETAIL_CACHE_TTL", 7 * 24 * 60 * 60))
+# pages of resumes without an update time may change under the same key, so they are kept like search results
+DETAIL_CACHE_UNDATED_TTL = int(os.getenv("DETAIL_CACHE_UNDATED_TTL", DEFAULT_CACHE_TTL))
+
+
+def normalize_filter_value(value):
+    if isinstance(value, str):
+        return " ".join(value.strip().lower().split())
+    return value
+
+
+def make_cache_key(site: str, filters: dict, **extra) -> str:
+    """
+    Builds the same key for searches that differ only in case, spacing, empty filters
+    or spelling of a known city
+    """
+    canonical_filters = {
+        name: normalize_filter_value(value)
+        for name, value in filters.items()
+        if value not in (None, "")
+    }
+    location = filters.get("location")
+    if location:
+        # "Київ", "Kyiv" and "киев" are the same search
+        city_slug = find_work_ua_city_slug(location)
+        canonical_filters["location"] = city_slug if city_slug is not None else normalize_city_name(location)
+    return json.dumps({"site": site, "filters": canonical_filters, **extra}, sort_keys=True, ensure_ascii=False)
+
+
+class MemoryCacheBackend:
+    """
+    Least recently used in-memory storage
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, tuple[str, float]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SqliteCacheBackend:
+    """
+    On-disk storage, keeps cached searches between bot restarts
+    """
+
+    def __init__(self, path: str, max_entries: int) -> None:
+        self.max_entries = max_entries
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS search_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS search_cache_last_used ON search_cache (last_used)")
+        self._connection.commit()
+
+    def get(self, key: str) -> tuple[str, float] | None:
+        row = self._connection.execute(
+            "SELECT value, expires_at FROM search_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._connection.execute("UPDATE search_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+        return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        self._connection.execute(
+            "INSERT OR REPLACE INTO search_cache (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+            (key, value, expires_at, time.time()),
+        )
+        # drop expired entries first, then least recently used ones above the limit
+        self._connection.execute("DELETE FROM search_cache WHERE expires_at < ?", (time.time(),))
+        self._connection.execute(
+            "DELETE FROM search_cache WHERE key NOT IN "
+            "(SELECT key FROM search_cache ORDER BY last_used DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+        self._connection.commit()
+
+    def delete(self, key: str) -> None:
+        self._connection.execute("DELETE FROM search_cache WHERE key = ?", (key,))
+        self._connection.commit()
+
+    def __len__(self) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    stores: int = 0
+
+    def as_dict(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "stores": self.stores,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ResultCache:
+    """
+    Cache of search results with per-site TTLs in front of the scrapers
+    """
+
+    def __init__(self, backend, ttls: dict | None = None, default_ttl: int = DEFAULT_CACHE_TTL) -> None:
+        self.backend = backend
+        self.ttls = ttls or {}
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        # sqlite connection is not safe to use from several threads at once
+        self._lock = asyncio.Lock()
+
+    async def get(self, key: str):
+        async with self._lock:
+            entry = await asyncio.to_thread(self.backend.get, key)
+            if entry is not None and entry[1] < time.time():
+                self.stats.expired += 1
+                await asyncio.to_thread(self.backend.delete, key)
+                entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return None
+        self.stats.hits += 1
+        return json.loads(entry[0])
+
+    async def set(self, key: str, value, site: str, ttl: float | None = None) -> None:
+        """
+        Stores the value for `ttl` seconds, for the site's TTL by default
+        """
+        expires_at = time.time() + (ttl if ttl is not None else self.ttls.get(site, self.default_ttl))
+        async with self._lock:
+            await asyncio.to_thread(self.backend.set, key, json.dumps(value, ensure_ascii=False), expires_at)
+        self.stats.stores += 1
+
+
+def create_cache_backend(path: str | None, max_entries: int):
+    if path:
+        return SqliteCacheBackend(path, max_entries)
+    return MemoryCacheBackend(max_entries)
+
+
+def create_result_cache() -> ResultCache:
+    backend = create_cache_backend(os.getenv("RESULT_CACHE_PATH"), int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 1000)))
+    return ResultCache(backend, ttls=RESULT_CACHE_TTLS)
+
+
+def create_detail_cache() -> ResultCache:
+    backend = create_cache_backend(os.getenv("DETAIL_CACHE_PATH"), int(os.getenv("DETAIL_CACHE_MAX_ENTRIES", 10000)))
+    return ResultCache(backend, default_ttl=DETAIL_CACHE_TTL)
+
+
+result_cache = create_result_cache()
+detail_cache = create_detail_cache()
+metrics.register_gauges("result_cache", result_cache.stats.as_dict)
+metrics.register_gauges("detail_cache", detail_cache.stats.as_dict)
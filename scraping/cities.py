@@ -0,0 +1,58 @@
+# work.ua city slugs used in search urls, e.g. https://www.work.ua/resumes-kyiv-python/
+WORK_UA_CITY_SLUGS = {
+    "kyiv": ("київ", "киев", "kyiv", "kiev"),
+    "kharkiv": ("харків", "харьков", "kharkiv", "kharkov"),
+    "odesa": ("одеса", "одесса", "odesa", "odessa"),
+    "dnipro": ("дніпро", "днепр", "dnipro", "dnepr"),
+    "lviv": ("львів", "львов", "lviv", "lvov"),
+    "zaporizhzhia": ("запоріжжя", "запорожье", "zaporizhzhia", "zaporozhye"),
+    "vinnytsia": ("вінниця", "винница", "vinnytsia", "vinnitsa"),
+    "mykolaiv": ("миколаїв", "николаев", "mykolaiv", "nikolaev"),
+    "poltava": ("полтава", "poltava"),
+    "chernihiv": ("чернігів", "чернигов", "chernihiv", "chernigov"),
+    "cherkasy": ("черкаси", "черкассы", "cherkasy"),
+    "zhytomyr": ("житомир", "zhytomyr"),
+    "sumy": ("суми", "сумы", "sumy"),
+    "khmelnytskyi": ("хмельницький", "хмельницкий", "khmelnytskyi"),
+    "rivne": ("рівне", "ровно", "rivne"),
+    "ivano-frankivsk": ("івано-франківськ", "ивано-франковск", "ivano-frankivsk"),
+    "ternopil": ("тернопіль", "тернополь", "ternopil"),
+    "lutsk": ("луцьк", "луцк", "lutsk"),
+    "uzhhorod": ("ужгород", "uzhhorod"),
+    "chernivtsi": ("чернівці", "черновцы", "chernivtsi"),
+    "kropyvnytskyi": ("кропивницький", "кропивницкий", "kropyvnytskyi"),
+    "kherson": ("херсон", "kherson"),
+    "kryvyi_rih": ("кривий ріг", "кривой рог", "kryvyi rih", "krivoy rog"),
+    "kremenchuk": ("кременчук", "кременчуг", "kremenchuk"),
+    "bila_tserkva": ("біла церква", "белая церковь", "bila tserkva"),
+    "kamianske": ("кам'янське", "каменское", "kamianske"),
+    "kamianets-podilskyi": ("кам'янець-подільський", "каменец-подольский", "kamianets-podilskyi"),
+    "brovary": ("бровари", "бровары", "brovary"),
+    "boryspil": ("бориспіль", "борисполь", "boryspil"),
+    "irpin": ("ірпінь", "ирпень", "irpin"),
+    "bucha": ("буча", "bucha"),
+    "uman": ("умань", "uman"),
+    "mukachevo": ("мукачево", "mukachevo"),
+    "drohobych": ("дрогобич", "дрогобыч", "drohobych"),
+    "remote": ("дистанційно", "удаленно", "remote"),
+}
+# names that mean "search in the whole country", they have no slug in the url
+ALL_UKRAINE = ("вся україна", "вся украина", "all ukraine", "україна", "украина", "ukraine")
+
+_CITY_ALIASES = {alias: slug for slug, aliases in WORK_UA_CITY_SLUGS.items() for alias in aliases}
+
+
+def normalize_city_name(name: str) -> str:
+    return " ".join(name.strip().lower().replace("’", "'").replace("ʼ", "'").split())
+
+
+def find_work_ua_city_slug(location: str | None) -> str | None:
+    """
+    Returns work.ua slug for the city, empty string for whole Ukraine and None for unknown cities
+    """
+    if not location:
+        return ""
+    name = normalize_city_name(location)
+    if name in ALL_UKRAINE:
+        return ""
+    return _CITY_ALIASES.get(name)
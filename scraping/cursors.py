@@ -0,0 +1,93 @@
+import os
+import secrets
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from scraping.cache import ResultCache, create_cache_backend
+from scraping.metrics import metrics
+from scraping.records import Resume, dump_resumes, load_resumes
+
+load_dotenv()
+
+
+@dataclass(slots=True)
+class ResultCursor:
+    cursor_id: str
+    user_id: int
+    resumes: tuple[Resume, ...]
+    total_resumes: int
+    warning: str | None
+    expires_at: float
+    # site and filters the results were found with, {"job_site": ..., "filters": {...}}
+    search: dict | None = None
+
+    def page(self, page: int, page_size: int) -> tuple[Resume, ...]:
+        return self.resumes[page * page_size:(page + 1) * page_size]
+
+    def page_count(self, page_size: int) -> int:
+        return max(1, -(-len(self.resumes) // page_size))
+
+
+class CursorStore:
+    """
+    Keeps search results under a short id for `ttl` seconds, so the bot can page through them
+    without scraping again. With a `shared` cache other bot processes can page through them too
+    """
+
+    def __init__(self, ttl: float, max_cursors: int, shared: ResultCache | None = None) -> None:
+        self.ttl = ttl
+        self.max_cursors = max_cursors
+        self.shared = shared
+        self._cursors: OrderedDict[str, ResultCursor] = OrderedDict()
+
+    async def create(self, user_id: int, resume_cards: list[Resume], total_resumes: int,
+                     warning: str | None, search: dict | None = None) -> ResultCursor:
+        self.prune()
+        # short id, callback data of a button is limited to 64 bytes
+        cursor = ResultCursor(secrets.token_urlsafe(6), user_id, tuple(resume_cards), total_resumes, warning,
+                              time.monotonic() + self.ttl, search)
+        self._cursors[cursor.cursor_id] = cursor
+        while len(self._cursors) > self.max_cursors:
+            self._cursors.popitem(last=False)
+        if self.shared:
+            await self.shared.set(cursor.cursor_id,
+                                  [user_id, dump_resumes(resume_cards), total_resumes, warning, search], "")
+        return cursor
+
+    async def get(self, cursor_id: str) -> ResultCursor | None:
+        cursor = self._cursors.get(cursor_id)
+        if cursor is None and self.shared:
+            # created by another process
+            stored = await self.shared.get(cursor_id)
+            if stored is not None:
+                user_id, resume_cards, total_resumes, warning, search = stored
+                cursor = ResultCursor(cursor_id, user_id, tuple(load_resumes(resume_cards)), total_resumes, warning,
+                                      time.monotonic() + self.ttl, search)
+        if cursor is None or cursor.expires_at < time.monotonic():
+            return None
+        return cursor
+
+    def prune(self) -> None:
+        # cursors are created in expiry order, so expired ones are at the start
+        now = time.monotonic()
+        while self._cursors and next(iter(self._cursors.values())).expires_at < now:
+            self._cursors.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._cursors)
+
+
+result_cursor_ttl = float(os.getenv("RESULT_CURSOR_TTL", 60 * 60))
+result_cursor_max = int(os.getenv("RESULT_CURSOR_MAX", 10000))
+# sqlite file shared by bot processes, empty when a single process runs the bot
+result_cursor_path = os.getenv("RESULT_CURSOR_PATH")
+result_cursors = CursorStore(
+    ttl=result_cursor_ttl,
+    max_cursors=result_cursor_max,
+    shared=ResultCache(create_cache_backend(result_cursor_path, result_cursor_max), default_ttl=result_cursor_ttl)
+    if result_cursor_path else None,
+)
+metrics.register_gauges("result_cursors", lambda: {"stored": len(result_cursors)})
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import os
+import random
+
+from dotenv import load_dotenv
+
+from scraping.cache import DETAIL_CACHE_UNDATED_TTL, ResultCache, detail_cache
+from scraping.governor import CircuitOpenError
+from scraping.metrics import metrics
+from scraping.records import Resume
+
+load_dotenv()
+
+
+class DetailFetcher:
+    """
+    Loads resume pages with at most `concurrency` requests per site at once and a pause after each one.
+    Parsed details are cached by link and last update time of the resume, so unchanged resumes are never re-fetched
+    """
+
+    def __init__(self, cache: ResultCache, concurrency: int, delay: float) -> None:
+        self.cache = cache
+        self.concurrency = concurrency
+        self.delay = delay
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+
+    def semaphore(self, site: str) -> asyncio.Semaphore:
+        if site not in self._semaphores:
+            self._semaphores[site] = asyncio.Semaphore(self.concurrency)
+        return self._semaphores[site]
+
+    @staticmethod
+    def cache_key(link: str, updated_at: str | None) -> str:
+        return json.dumps({"resume": link, "updated_at": updated_at})
+
+    async def fetch_details(self, engine, link: str, updated_at: str | None = None) -> dict | None:
+        """
+        Returns details parsed by `engine.fetch_resume_details`, None if the page can't be loaded
+        """
+        site = engine.site_name
+        cache_key = self.cache_key(link, updated_at)
+        details = await self.cache.get(cache_key)
+        if details is not None:
+            return details
+
+        async with self.semaphore(site):
+            try:
+                with metrics.span("resume_details", site=site):
+                    details = await engine.fetch_resume_details(link)
+            except CircuitOpenError:
+                # details are extras, the cards are still shown without them
+                return None
+            # politeness delay keeps the slot busy, so the site sees at most `concurrency` requests per delay
+            await asyncio.sleep(self.delay * random.uniform(1, 1.5))
+        if details is not None:
+            await self.cache.set(cache_key, details, site, None if updated_at else DETAIL_CACHE_UNDATED_TTL)
+        return details
+
+    async def add_details(self, engine, resume_cards: list[Resume]) -> list[Resume]:
+        """
+        Sets details of every card, cards with pages that failed to load are left without them
+        """
+        all_details = await asyncio.gather(*(self.fetch_details(engine, resume_card.link, resume_card.updated_at)
+                                             for resume_card in resume_cards))
+        for resume_card, details in zip(resume_cards, all_details):
+            if details is not None:
+                resume_card.details = details
+        return resume_cards
+
+
+detail_fetcher = DetailFetcher(
+    detail_cache,
+    concurrency=int(os.getenv("DETAIL_CONCURRENCY", 3)),
+    delay=float(os.getenv("DETAIL_DELAY", 0.5)),
+)
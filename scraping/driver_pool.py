@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+from selenium.common.exceptions import WebDriverException
+
+from scraping.metrics import metrics
+from scraping.scrapers import BaseResumeScraper
+
+logger = logging.getLogger(__name__)
+
+
+class DriverPoolTimeoutError(Exception):
+    """
+    Raised when no driver could be leased from the pool in time
+    """
+
+
+@dataclass
+class PooledDriver:
+    driver: object
+    uses: int = 0
+    created_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class DriverPoolStats:
+    size: int = 0
+    idle: int = 0
+    leased: int = 0
+    created: int = 0
+    recycled: int = 0
+    crashed: int = 0
+    lease_timeouts: int = 0
+    leases: int = 0
+    total_wait_time: float = 0.0
+    max_wait_time: float = 0.0
+    total_lease_duration: float = 0.0
+    max_lease_duration: float = 0.0
+
+    def as_dict(self) -> dict:
+        leases = self.leases or 1
+        return {
+            "size": self.size,
+            "idle": self.idle,
+            "leased": self.leased,
+            "created": self.created,
+            "recycled": self.recycled,
+            "crashed": self.crashed,
+            "lease_timeouts": self.lease_timeouts,
+            "leases": self.leases,
+            "avg_wait_time": self.total_wait_time / leases,
+            "max_wait_time": self.max_wait_time,
+            "avg_lease_duration": self.total_lease_duration / leases,
+            "max_lease_duration": self.max_lease_duration,
+        }
+
+
+class DriverPool:
+    """
+    Bounded pool of warm WebDriver sessions.
+    Drivers are created on startup, leased per search, cleaned between leases
+    and replaced after `max_uses` leases or when they stop responding
+    """
+
+    def __init__(self, size: int, max_uses: int, lease_timeout: float, driver_factory=None) -> None:
+        self.size = size
+        self.max_uses = max_uses
+        self.lease_timeout = lease_timeout
+        self.driver_factory = driver_factory or BaseResumeScraper.init_driver
+        self.stats = DriverPoolStats(size=size)
+        self._idle: asyncio.Queue[PooledDriver | None] | None = None
+        self._started = False
+        # searches arriving before the warm-up is over wait for it instead of starting another one
+        self._start_lock = asyncio.Lock()
+
+    async def start(self) -> None:
+        """
+        Warms up the pool, should be called once on bot startup, the first lease starts it otherwise
+        """
+        async with self._start_lock:
+            if self._started:
+                return
+            creating = [asyncio.ensure_future(self._create()) for _ in range(self.size)]
+            try:
+                pooled_drivers = await asyncio.gather(*creating)
+            except BaseException:
+                # browsers that did start must not outlive a failed warm-up
+                for task in creating:
+                    task.cancel()
+                for result in await asyncio.gather(*creating, return_exceptions=True):
+                    if isinstance(result, PooledDriver):
+                        await self._quit(result)
+                raise
+            self._idle = asyncio.Queue(maxsize=self.size)
+            for pooled_driver in pooled_drivers:
+                self._idle.put_nowait(pooled_driver)
+            self._started = True
+            self._update_gauges()
+
+    async def close(self) -> None:
+        async with self._start_lock:
+            if not self._started:
+                return
+            while not self._idle.empty():
+                pooled_driver = self._idle.get_nowait()
+                if pooled_driver is not None:
+                    await self._quit(pooled_driver)
+            self._started = False
+            self._update_gauges()
+
+    @asynccontextmanager
+    async def lease(self, timeout: float | None = None):
+        """
+        Leases a driver for the duration of the `async with` block
+        """
+        if not self._started:
+            await self.start()
+
+        wait_started = time.monotonic()
+        try:
+            pooled_driver = await asyncio.wait_for(self._idle.get(), timeout or self.lease_timeout)
+        except asyncio.TimeoutError:
+            self.stats.lease_timeouts += 1
+            raise DriverPoolTimeoutError("All browser sessions are busy, try again later")
+
+        if pooled_driver is None:
+            # slot whose driver could not be replaced earlier
+            try:
+                pooled_driver = await self._create()
+            except BaseException:
+                # the slot stays in the pool, its driver is created on the next lease
+                self._idle.put_nowait(None)
+                raise
+        wait_time = time.monotonic() - wait_started
+        metrics.observe("driver_lease_wait", wait_time)
+        self.stats.leases += 1
+        self.stats.total_wait_time += wait_time
+        self.stats.max_wait_time = max(self.stats.max_wait_time, wait_time)
+        self._update_gauges()
+
+        lease_started = time.monotonic()
+        crashed = False
+        try:
+            yield pooled_driver.driver
+        except WebDriverException:
+            crashed = True
+            raise
+        finally:
+            lease_duration = time.monotonic() - lease_started
+            metrics.observe("driver_lease", lease_duration)
+            self.stats.total_lease_duration += lease_duration
+            self.stats.max_lease_duration = max(self.stats.max_lease_duration, lease_duration)
+            pooled_driver.uses += 1
+            # a cancelled search must not take the driver's slot with it
+            await asyncio.shield(self._release(pooled_driver, crashed))
+
+    @asynccontextmanager
+    async def lease_idle(self, max_count: int):
+        """
+        Leases up to `max_count` drivers that are idle right now, without waiting for busy ones.
+        Used to spread pagination of one search over spare sessions
+        """
+        if not self._started:
+            await self.start()
+
+        pooled_drivers = []
+        while len(pooled_drivers) < max_count and not self._idle.empty():
+            pooled_driver = self._idle.get_nowait()
+            if pooled_driver is None:
+                self._idle.put_nowait(None)
+                break
+            pooled_drivers.append(pooled_driver)
+        self.stats.leases += len(pooled_drivers)
+        self._update_gauges()
+
+        lease_started = time.monotonic()
+        try:
+            yield [pooled_driver.driver for pooled_driver in pooled_drivers]
+        finally:
+            lease_duration = time.monotonic() - lease_started
+            for pooled_driver in pooled_drivers:
+                self.stats.total_lease_duration += lease_duration
+                self.stats.max_lease_duration = max(self.stats.max_lease_duration, lease_duration)
+                pooled_driver.uses += 1
+                await asyncio.shield(self._release(pooled_driver, crashed=False))
+
+    async def _release(self, pooled_driver: PooledDriver, crashed: bool) -> None:
+        healthy = not crashed and await self._reset(pooled_driver.driver)
+        if not healthy:
+            self.stats.crashed += 1
+        if not healthy or pooled_driver.uses >= self.max_uses:
+            await self._quit(pooled_driver)
+            self.stats.recycled += 1
+            try:
+                pooled_driver = await self._create()
+            except WebDriverException as error:
+                logger.warning("Could not replace browser session, it will be created on next lease: %s", error)
+                pooled_driver = None
+        self._idle.put_nowait(pooled_driver)
+        self._update_gauges()
+
+    async def _create(self) -> PooledDriver:
+        loop = asyncio.get_running_loop()
+        starting = loop.run_in_executor(None, self.driver_factory)
+        try:
+            driver = await asyncio.shield(starting)
+        except asyncio.CancelledError:
+            # the browser keeps starting in its thread, it is quit as soon as it is up
+            starting.add_done_callback(self._quit_started)
+            raise
+        self.stats.created += 1
+        return PooledDriver(driver=driver)
+
+    @staticmethod
+    def _quit_started(starting: asyncio.Future) -> None:
+        if starting.cancelled() or starting.exception() is not None:
+            return
+        asyncio.get_running_loop().run_in_executor(None, DriverPool._quit_quietly, starting.result())
+
+    @staticmethod
+    async def _reset(driver) -> bool:
+        """
+        Clears cookies and storage left by the previous lease, returns False if the driver is dead
+        """
+        loop = asyncio.get_running_loop()
+
+        def reset():
+            driver.delete_all_cookies()
+            driver.execute_script("try { window.localStorage.clear(); window.sessionStorage.clear(); } catch (e) {}")
+            driver.get("about:blank")
+
+        try:
+            await loop.run_in_executor(None, reset)
+            return True
+        except WebDriverException:
+            return False
+
+    @staticmethod
+    def _quit_quietly(driver) -> None:
+        try:
+            driver.quit()
+        except WebDriverException:
+            pass
+
+    @staticmethod
+    async def _quit(pooled_driver: PooledDriver) -> None:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, DriverPool._quit_quietly, pooled_driver.driver)
+
+    def _update_gauges(self) -> None:
+        idle = self._idle.qsize() if self._started else 0
+        self.stats.idle = idle
+        self.stats.leased = self.size - idle if self._started else 0
+
+
+driver_pool = DriverPool(
+    size=int(os.getenv("DRIVER_POOL_SIZE", 2)),
+    max_uses=int(os.getenv("DRIVER_POOL_MAX_USES", 50)),
+    lease_timeout=float(os.getenv("DRIVER_POOL_LEASE_TIMEOUT", 60)),
+)
+metrics.register_gauges("driver_pool", driver_pool.stats.as_dict)
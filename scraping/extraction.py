@@ -0,0 +1,85 @@
+import asyncio
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup
+from selenium.webdriver.common.by import By
+
+from scraping.metrics import metrics
+from scraping.records import Resume
+
+# collects every field of every card inside the browser, so a page costs one WebDriver round trip
+EXTRACT_CARDS_SCRIPT = """
+const [cardSelector, fields] = arguments;
+return Array.from(document.querySelectorAll(cardSelector)).map((card) => {
+    const record = {};
+    for (const [name, [selector, attribute]] of Object.entries(fields)) {
+        const element = selector ? card.querySelector(selector) : card;
+        if (!element) {
+            record[name] = null;
+        } else if (attribute === "text") {
+            record[name] = element.textContent.replace(/\\s+/g, " ").trim();
+        } else {
+            record[name] = element[attribute] ?? element.getAttribute(attribute);
+        }
+    }
+    return record;
+});
+"""
+
+
+def css(locator: tuple[str, str]) -> str:
+    """
+    Returns css selector of the selenium locator, so the same locators work with BeautifulSoup and js
+    """
+    by, selector = locator
+    if by != By.CSS_SELECTOR:
+        raise ValueError(f"Only css selector locators can be used for extraction, got {by}")
+    return selector
+
+
+def fields_to_selectors(fields: dict) -> dict:
+    return {name: [css(locator) if locator else None, attribute] for name, (locator, attribute) in fields.items()}
+
+
+async def extract_cards(driver, card_locator: tuple[str, str], fields: dict) -> list[dict]:
+    """
+    Extracts `fields` of every card matched by `card_locator` with a single execute_script call
+    :param driver: selenium driver with loaded page
+    :param card_locator: css locator of a card
+    :param fields: mapping of field name to (locator inside the card or None for the card itself, attribute or "text")
+    """
+    loop = asyncio.get_running_loop()
+    metrics.increment("webdriver_calls_total")
+    return await loop.run_in_executor(
+        None,
+        lambda: driver.execute_script(EXTRACT_CARDS_SCRIPT, css(card_locator), fields_to_selectors(fields)),
+    )
+
+
+def extract_cards_from_soup(soup: BeautifulSoup, card_locator: tuple[str, str], fields: dict,
+                            base_url: str = "") -> list[dict]:
+    """
+    Same as extract_cards, but for html loaded without a browser. Relative links are joined with `base_url`
+    """
+    records = []
+    for card in soup.select(css(card_locator)):
+        record = {}
+        for name, (locator, attribute) in fields.items():
+            element = card.select_one(css(locator)) if locator else card
+            if element is None:
+                record[name] = None
+            elif attribute == "text":
+                record[name] = " ".join(element.get_text(" ").split())
+            elif attribute in ("href", "src"):
+                record[name] = urljoin(base_url, element.get(attribute)) if element.get(attribute) else None
+            else:
+                record[name] = element.get(attribute)
+        records.append(record)
+    return records
+
+
+def records_to_resumes(records: list[dict], link_field: str = "href") -> list[Resume]:
+    """
+    Converts extracted records into resumes, records without a link are skipped
+    """
+    return [resume for resume in (Resume.from_record(record, link_field) for record in records) if resume]
@@ -0,0 +1,264 @@
+import asyncio
+import ipaddress
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from scraping.metrics import metrics
+
+load_dotenv()
+
+# statuses the sites answer with when they want us to slow down
+THROTTLE_STATUSES = {429, 503}
+# share of the configured rate given back after every successful request of a slowed down site
+RATE_RECOVERY = 0.1
+# a throttled site is never slowed down below this share of its configured rate
+MIN_RATE_SHARE = 0.05
+
+
+class SiteUnavailableError(Exception):
+    """
+    Raised when a site can't be reached and there is no other way to get its resumes
+    """
+
+
+class CircuitOpenError(SiteUnavailableError):
+    """
+    Raised instead of sending a request to a site that keeps failing
+    """
+
+
+class ThrottledError(Exception):
+    """
+    Raised by a request the site answered with "too many requests"
+    """
+
+    def __init__(self, retry_after: float | None = None) -> None:
+        super().__init__(f"throttled by the site, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: str | None) -> float | None:
+    """
+    Seconds from the Retry-After header, which is either a number of seconds or a date
+    """
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def site_of(url: str) -> str:
+    """
+    Governed site of the url, "www.work.ua" and "employer-api.robota.ua" are limited as "work.ua" and "robota.ua"
+    """
+    parts = urlsplit(url)
+    hostname = parts.hostname or ""
+    try:
+        ipaddress.ip_address(hostname)
+        return parts.netloc
+    except ValueError:
+        return ".".join(hostname.split(".")[-2:])
+
+
+class TokenBucket:
+    """
+    Lets `rate` requests per second through on average and up to `burst` at once.
+    Callers wait in turn, so every one of them gets its own token
+    """
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self) -> float:
+        """
+        Takes a token, returns seconds spent waiting for it
+        """
+        started_at = time.monotonic()
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.refill(now)
+                wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.tokens -= 1
+        return time.monotonic() - started_at
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds every request for `seconds`, no burst is let through right after the pause
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` failures in a row and rejects requests for `reset_timeout` seconds,
+    then lets one probe request through, which closes it on success or opens it again on failure
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.probe_started_at: float | None = None
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "open":
+            return False
+        now = time.monotonic()
+        # a probe that never reported back (e.g. cancelled search) doesn't block the site forever
+        if self.probe_started_at is None or now - self.probe_started_at > self.reset_timeout:
+            self.probe_started_at = now
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.probe_started_at = None
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.probe_started_at = None
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+
+class SiteGovernor:
+    """
+    Request budget of one site shared by all searches: rate limit that halves when the site throttles us
+    and recovers with successful requests, backoff with jitter after failures and a circuit breaker
+    """
+
+    def __init__(self, site: str, rate: float, burst: int, retries: int, backoff_base: float, backoff_max: float,
+                 failure_threshold: int, reset_timeout: float) -> None:
+        self.site = site
+        self.max_rate = rate
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    def backoff(self, attempt: int) -> float:
+        # full jitter, so searches that failed together don't come back together
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def slow_down(self, retry_after: float) -> None:
+        self.bucket.rate = max(self.max_rate * MIN_RATE_SHARE, self.bucket.rate / 2)
+        # a site asking to come back in an hour would otherwise stall every search until then
+        self.bucket.pause(min(retry_after, self.backoff_max))
+
+    def record_success(self) -> None:
+        self.breaker.record_success()
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.max_rate * RATE_RECOVERY)
+
+    def record_failure(self) -> None:
+        self.breaker.record_failure()
+        self.bucket.pause(self.backoff(self.breaker.failures - 1))
+        if self.breaker.state == "open":
+            metrics.increment("circuit_opened_total", site=self.site)
+
+    async def call(self, request):
+        """
+        Runs `request()` once the site's budget allows it and returns its result.
+        Throttled requests are repeated after a pause, other failures are raised to the caller.
+        Raises CircuitOpenError without calling the site while it is considered down
+        """
+        if not self.breaker.allow():
+            metrics.increment("circuit_rejections_total", site=self.site)
+            raise CircuitOpenError(f"{self.site} is unavailable right now, please try again later")
+
+        for attempt in range(self.retries + 1):
+            waited = await self.bucket.acquire()
+            if waited > 0:
+                metrics.observe("throttle_wait", waited, site=self.site)
+            try:
+                result = await request()
+            except ThrottledError as error:
+                metrics.increment("throttled_responses_total", site=self.site)
+                self.slow_down(error.retry_after if error.retry_after is not None else self.backoff(attempt))
+                if attempt < self.retries:
+                    continue
+                self.record_failure()
+                raise
+            except Exception:
+                self.record_failure()
+                raise
+            self.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "rate": round(self.bucket.rate, 3),
+            "circuit_open": int(self.breaker.state == "open"),
+            "consecutive_failures": self.breaker.failures,
+        }
+
+
+class GovernorRegistry:
+    """
+    One governor per site, created on the first request to it
+    """
+
+    def __init__(self, **settings) -> None:
+        self.settings = settings
+        self._governors: dict[str, SiteGovernor] = {}
+
+    def for_url(self, url: str) -> SiteGovernor:
+        site = site_of(url)
+        if site not in self._governors:
+            self._governors[site] = SiteGovernor(site, **self.settings)
+        return self._governors[site]
+
+    def stats(self) -> dict:
+        return {
+            f"{site.replace('.', '_').replace(':', '_')}_{name}": value
+            for site, governor in self._governors.items()
+            for name, value in governor.stats().items()
+        }
+
+
+site_governors = GovernorRegistry(
+    rate=float(os.getenv("SITE_RATE_LIMIT", 3)),
+    burst=int(os.getenv("SITE_BURST", 5)),
+    retries=int(os.getenv("SITE_THROTTLE_RETRIES", 2)),
+    backoff_base=float(os.getenv("SITE_BACKOFF_BASE", 1)),
+    backoff_max=float(os.getenv("SITE_BACKOFF_MAX", 30)),
+    failure_threshold=int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", 5)),
+    reset_timeout=float(os.getenv("CIRCUIT_RESET_TIMEOUT", 60)),
+)
+metrics.register_gauges("site_governor", site_governors.stats)
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+
+import aiohttp
+from dotenv import load_dotenv
+
+from scraping.governor import THROTTLE_STATUSES, ThrottledError, parse_retry_after, site_governors
+from scraping.metrics import metrics
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HEADERS = {
+    "User-Agent": ("Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                   "(KHTML, like Gecko) Chrome/121.0.0.0 Safari/537.36 Edg/121.0.0.0"),
+    "Accept-Language": "uk-UA,uk;q=0.9,en;q=0.8",
+}
+
+
+class ClientStatusError(aiohttp.ClientError):
+    """
+    Raised for 4xx answers other than throttling
+    """
+
+
+class HttpClient:
+    """
+    Shared aiohttp session, keeps connections to the scraped sites alive between searches
+    """
+
+    def __init__(self, pool_size: int, timeout: float) -> None:
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    def get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers=DEFAULT_HEADERS,
+            )
+        return self._session
+
+    async def request(self, url: str, read, method: str = "GET", engine: str = "http", **kwargs):
+        """
+        Sends the request within the site's budget and returns `read(response)`.
+        Raises CircuitOpenError while the site is down, other failures are raised as aiohttp errors
+        """
+        async def send():
+            with metrics.span("page_load", engine=engine):
+                async with self.get_session().request(method, url, **kwargs) as response:
+                    if response.status in THROTTLE_STATUSES:
+                        raise ThrottledError(parse_retry_after(response.headers.get("Retry-After")))
+                    if response.status >= 500:
+                        response.raise_for_status()
+                    if response.status >= 400:
+                        return response.status, None
+                    return response.status, await read(response)
+
+        status, data = await site_governors.for_url(url).call(send)
+        if status >= 400:
+            # missing page is an answer of a working site, it doesn't count towards its failures
+            raise ClientStatusError(f"{status}, url={url}")
+        return data
+
+    async def fetch_text(self, url: str, **kwargs) -> str | None:
+        """
+        Method to get html code of the page without a browser
+        """
+        try:
+            text = await self.request(url, lambda response: response.text(), **kwargs)
+            metrics.increment("pages_fetched_total", engine="http")
+            return text
+        except (aiohttp.ClientError, asyncio.TimeoutError, ThrottledError) as error:
+            metrics.increment("page_fetch_failures_total", engine="http")
+            logger.warning("An error occurred while trying to fetch the HTML from %s: %s", url, error)
+            return None
+
+    async def fetch_json(self, url: str, method: str = "GET", **kwargs):
+        """
+        Method to call JSON APIs of the sites, returns None on failure
+        """
+        try:
+            data = await self.request(url, lambda response: response.json(content_type=None), method=method,
+                                      engine="api", **kwargs)
+            metrics.increment("pages_fetched_total", engine="api")
+            return data
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, ThrottledError) as error:
+            metrics.increment("page_fetch_failures_total", engine="api")
+            logger.warning("An error occurred while trying to fetch JSON from %s: %s", url, error)
+            return None
+
+    async def close(self) -> None:
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+http_client = HttpClient(
+    pool_size=int(os.getenv("HTTP_POOL_SIZE", 20)),
+    timeout=float(os.getenv("HTTP_TIMEOUT", 15)),
+)
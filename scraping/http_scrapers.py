@@ -0,0 +1,348 @@
+import math
+import os
+from contextlib import aclosing
+from urllib.parse import urljoin, urlsplit
+
+from bs4 import BeautifulSoup
+
+from scraping.cities import ALL_UKRAINE, normalize_city_name
+from scraping.extraction import css, extract_cards_from_soup, records_to_resumes
+from scraping.http_client import http_client
+from scraping.locators import work_ua_locators
+from scraping.records import Resume
+from scraping.scrapers import PAGE_RETRIES, PAGE_TIMEOUT, WorkUaScraper, prefetch_window, results_dict
+from scraping.url_builder import WorkUaSearchUrlBuilder
+from scraping.utils import iter_pages_concurrently, parse_resumes_found_counter
+
+
+class WorkUaHttpScraper:
+    """
+    Browserless resume scrapper for work.ua, loads search result pages over HTTP
+    and parses them with BeautifulSoup
+    """
+
+    site_name = WorkUaScraper.site_name
+    work_experience = WorkUaScraper.work_experience
+    employment_type = WorkUaScraper.employment_type
+    salaries = WorkUaScraper.salaries
+
+    def __init__(self):
+        self.url_builder = WorkUaSearchUrlBuilder(os.getenv("WORK_UA_BASE_URL"), WorkUaScraper.filter_query_params)
+        self.site_url = self.url_builder.site_url
+        self.url = None
+        self.first_page = None
+        self.current_page = 0
+        self.total_pages = 1
+        self.warnings = []
+        self.failed_pages = []
+
+    def build_search_url(self, filters: dict) -> str | None:
+        """
+        Builds final search url from the filters, returns None if the city is unknown
+        """
+        return self.url_builder.build(filters)
+
+    page_url = staticmethod(WorkUaSearchUrlBuilder.page_url)
+
+    async def fetch_page(self, url: str) -> BeautifulSoup | None:
+        html = await http_client.fetch_text(url)
+        if html is None:
+            return None
+        return BeautifulSoup(html, "html.parser")
+
+    def parse_resume_cards(self, soup: BeautifulSoup) -> list[Resume]:
+        records = extract_cards_from_soup(soup, work_ua_locators.RESUME_CARD, work_ua_locators.RESUME_CARD_FIELDS,
+                                          base_url=self.site_url)
+        return records_to_resumes(records)
+
+    @staticmethod
+    def parse_total_pages(soup: BeautifulSoup) -> int:
+        pagination = soup.select_one(css(work_ua_locators.RESUME_PAGINATION))
+        if pagination is None:
+            return 1
+        page_numbers = [
+            int(page_link.get_text(strip=True))
+            for page_link in pagination.select(css(work_ua_locators.PAGINATION_LINKS))
+            if page_link.get_text(strip=True).isdigit()
+        ]
+        return max(page_numbers, default=1)
+
+    @staticmethod
+    def parse_resume_details(soup: BeautifulSoup) -> dict:
+        experience = []
+        for position in soup.select(css(work_ua_locators.RESUME_EXPERIENCE_POSITION)):
+            # period and company are the paragraphs right after the position heading
+            period, company = ([" ".join(paragraph.get_text(" ").split())
+                                for paragraph in position.find_next_siblings("p", limit=2)] + [None, None])[:2]
+            experience.append({
+                "position": " ".join(position.get_text(" ").split()),
+                "company": company,
+                "period": period,
+            })
+        salary = soup.select_one(css(work_ua_locators.RESUME_SALARY_EXPECTATION))
+        updated = soup.select_one(css(work_ua_locators.RESUME_UPDATED))
+        return {
+            "skills": [skill.get_text(strip=True) for skill in soup.select(css(work_ua_locators.RESUME_SKILLS))],
+            "experience": experience,
+            "salary_expectation": salary.get_text(strip=True) if salary else None,
+            "updated_at": updated.get("datetime") if updated else None,
+        }
+
+    async def fetch_resume_details(self, url: str) -> dict | None:
+        soup = await self.fetch_page(url)
+        return None if soup is None else self.parse_resume_details(soup)
+
+    async def open_search(self, filters: dict) -> bool:
+        """
+        Loads the first result page, returns False if the search can't be handled without a browser
+        """
+        url = self.build_search_url(filters)
+        if url is None:
+            return False
+
+        first_page = await self.fetch_page(url)
+        if first_page is None:
+            return False
+        has_cards = first_page.select_one(css(work_ua_locators.RESUME_CARD)) is not None
+        has_not_found_message = first_page.select_one(css(work_ua_locators.RESUMES_NOT_FOUND)) is not None
+        if not has_cards and not has_not_found_message:
+            # neither cards nor "not found" message, page is probably rendered by js or blocked
+            return False
+
+        self.url = url
+        self.first_page = first_page
+        self.current_page = 1
+        self.total_pages = self.parse_total_pages(first_page)
+        return True
+
+    async def iter_resume_cards(self, limit: int | None = None):
+        """
+        Yields resume cards page by page. Next pages are loaded only when the caller asks for more cards,
+        a window of them at once, enough for `limit` cards
+        """
+        resume_cards = self.parse_resume_cards(self.first_page)
+        for resume_card in resume_cards:
+            yield resume_card
+
+        async def fetch_resume_cards(page):
+            soup = await self.fetch_page(self.page_url(self.url, page))
+            return None if soup is None else self.parse_resume_cards(soup)
+
+        pages = iter_pages_concurrently(fetch_resume_cards, range(2, self.total_pages + 1),
+                                        prefetch_window(limit, len(resume_cards)), PAGE_RETRIES, PAGE_TIMEOUT)
+        async with aclosing(pages):
+            async for window_pages, resume_cards, failed_pages in pages:
+                self.current_page = window_pages[-1]
+                self.failed_pages.extend(failed_pages)
+                for resume_card in resume_cards:
+                    yield resume_card
+
+    async def count_resumes(self) -> int:
+        """
+        Reads total from the site's counter, or derives it from the last page instead of walking all pages
+        """
+        total_resumes = parse_resumes_found_counter(self.first_page.get_text(" "),
+                                                    work_ua_locators.RESUMES_FOUND_PATTERN)
+        if total_resumes is not None:
+            return total_resumes
+
+        cards_per_page = len(self.parse_resume_cards(self.first_page))
+        if self.total_pages == 1:
+            return cards_per_page
+        last_page = await self.fetch_page(self.page_url(self.url, self.total_pages))
+        if last_page is None:
+            return cards_per_page * self.total_pages  # estimate, last page may be shorter
+        return cards_per_page * (self.total_pages - 1) + len(self.parse_resume_cards(last_page))
+
+    async def parse_resumes(self, filters: dict) -> dict | None:
+        """
+        Returns all resumes in the same format as WorkUaScraper.parse_resumes,
+        or None if the page can't be handled without a browser
+        """
+        if not await self.open_search(filters):
+            return None
+        resume_cards = [resume_card async for resume_card in self.iter_resume_cards()]
+        return results_dict(resume_cards, self.warnings, self.failed_pages)
+
+
+class RobotaUaScraper:
+    """
+    Resume scrapper for robota.ua, works on the JSON API that powers the site's candidate search,
+    so it never needs a browser
+    """
+
+    site_name = "robota.ua"
+    browserless = True
+
+    # labels are the same as work.ua ones, so "all sites" search maps filters for both sites
+    work_experience = {
+        "Without experience": 0,
+        "Up to 1 year": 1,
+        "1-2 years": 2,
+        "2-5 years": 3,
+        "5+ years": 4,
+    }
+    employment_type = {
+        "Full time": 1,
+        "Part time": 2,
+    }
+    salaries = {salary: salary for salary in WorkUaScraper.salaries}
+
+    # city name -> robota.ua city id, loaded once from the dictionary endpoint
+    city_ids: dict[str, int] | None = None
+
+    def __init__(self):
+        base_url = urlsplit(os.getenv("ROBOTA_UA_BASE_URL"))
+        self.site_url = f"{base_url.scheme}://{base_url.netloc}"
+        self.api_url = os.getenv("ROBOTA_UA_API_URL", "https://employer-api.robota.ua/cvdb/resumes")
+        self.cities_url = os.getenv("ROBOTA_UA_CITIES_URL", "https://api.robota.ua/dictionary/city")
+        self.resume_api_url = os.getenv("ROBOTA_UA_RESUME_API_URL", "https://employer-api.robota.ua/resume")
+        self.search_body = None
+        self.first_page = None
+        self.current_page = 0
+        self.total_pages = 1
+        self.warnings = []
+        self.failed_pages = []
+
+    @classmethod
+    async def load_city_ids(cls, cities_url: str) -> dict[str, int]:
+        if cls.city_ids is None:
+            cities = await http_client.fetch_json(cities_url)
+            if cities is None:
+                return {}
+            cls.city_ids = {
+                normalize_city_name(city[language]): city["id"]
+                for city in cities
+                for language in ("ua", "ru", "en")
+                if city.get(language)
+            }
+        return cls.city_ids
+
+    async def find_city_id(self, location: str | None) -> int | None:
+        """
+        Returns robota.ua city id, 0 for whole Ukraine and None for unknown cities
+        """
+        if not location or normalize_city_name(location) in ALL_UKRAINE:
+            return 0
+        city_ids = await self.load_city_ids(self.cities_url)
+        return city_ids.get(normalize_city_name(location))
+
+    async def build_search_body(self, filters: dict) -> dict:
+        city_id = await self.find_city_id(filters.get("location"))
+        if city_id is None:
+            city_id = 0
+            self.warnings.append("Search is carried out throughout Ukraine, "
+                                 "if you wanted to search for resumes in a specific city, "
+                                 "check if you spelled ones name correctly")
+
+        work_experience = self.work_experience.get(filters.get("work_experience"))
+        employment_type = self.employment_type.get(filters.get("employment_type"))
+        return {
+            "keyWords": filters.get("job_position") or "",
+            "cityId": city_id,
+            "experienceIds": [str(work_experience)] if work_experience is not None else [],
+            "scheduleIds": [str(employment_type)] if employment_type is not None else [],
+            "salary": {
+                "from": self.salaries.get(filters.get("salary_from"), 0),
+                "to": self.salaries.get(filters.get("salary_to"), 0),
+            },
+            "period": "ThreeMonths",
+            "sort": "UpdateDate",
+            "showCvWithoutSalary": True,
+            "page": 0,
+        }
+
+    async def fetch_page(self, page: int) -> dict | None:
+        """
+        Loads one page of search results, pages are counted from 1 like on work.ua
+        """
+        return await http_client.fetch_json(self.api_url, method="POST", json={**self.search_body, "page": page - 1})
+
+    def parse_resume_cards(self, response: dict) -> list[Resume]:
+        resumes = []
+        for document in response.get("documents") or []:
+            salary = document.get("salary")
+            resumes.append(Resume(
+                link=urljoin(self.site_url, f"/candidates/{document.get('resumeId')}"),
+                candidate_occupation=document.get("speciality"),
+                candidate_name=document.get("displayName"),
+                candidate_age=document.get("age"),
+                candidate_city=document.get("cityName"),
+                candidate_salary=f"{salary} {document.get('currencySign', '')}".strip() if salary else None,
+                updated_at=document.get("updateDate"),
+            ))
+        return resumes
+
+    @staticmethod
+    def parse_resume_details(resume: dict) -> dict:
+        skills = resume.get("skills") or []
+        if isinstance(skills, str):
+            skills = [skill.strip() for skill in skills.split(",") if skill.strip()]
+        salary = resume.get("salary")
+        return {
+            "skills": skills,
+            "experience": [
+                {
+                    "position": experience.get("position"),
+                    "company": experience.get("company"),
+                    "period": f"{(experience.get('startWork') or '')[:7]} — {(experience.get('endWork') or '')[:7]}",
+                }
+                for experience in resume.get("experiences") or []
+            ],
+            "salary_expectation": f"{salary} {resume.get('currencySign', '')}".strip() if salary else None,
+            "updated_at": resume.get("updateDate"),
+        }
+
+    async def fetch_resume_details(self, url: str) -> dict | None:
+        resume_id = url.rstrip("/").rsplit("/", 1)[-1]
+        resume = await http_client.fetch_json(f"{self.resume_api_url}/{resume_id}")
+        return None if resume is None else self.parse_resume_details(resume)
+
+    async def open_search(self, filters: dict) -> bool:
+        """
+        Loads the first result page, returns False if the API is unavailable
+        """
+        self.search_body = await self.build_search_body(filters)
+        first_page = await self.fetch_page(1)
+        if first_page is None:
+            return False
+
+        self.first_page = first_page
+        self.current_page = 1
+        page_size = len(first_page.get("documents") or []) or 1
+        self.total_pages = max(1, math.ceil((first_page.get("total") or 0) / page_size))
+        return True
+
+    async def iter_resume_cards(self, limit: int | None = None):
+        """
+        Yields resume cards page by page. Next pages are loaded only when the caller asks for more cards,
+        a window of them at once, enough for `limit` cards
+        """
+        resume_cards = self.parse_resume_cards(self.first_page)
+        for resume_card in resume_cards:
+            yield resume_card
+
+        async def fetch_resume_cards(page):
+            response = await self.fetch_page(page)
+            return None if response is None else self.parse_resume_cards(response)
+
+        pages = iter_pages_concurrently(fetch_resume_cards, range(2, self.total_pages + 1),
+                                        prefetch_window(limit, len(resume_cards)), PAGE_RETRIES, PAGE_TIMEOUT)
+        async with aclosing(pages):
+            async for window_pages, resume_cards, failed_pages in pages:
+                self.current_page = window_pages[-1]
+                self.failed_pages.extend(failed_pages)
+                for resume_card in resume_cards:
+                    yield resume_card
+
+    async def count_resumes(self) -> int:
+        return self.first_page.get("total") or 0
+
+    async def parse_resumes(self, filters: dict) -> dict | None:
+        """
+        Returns all resumes in the same format as WorkUaScraper.parse_resumes, or None if the API is unavailable
+        """
+        if not await self.open_search(filters):
+            return None
+        resume_cards = [resume_card async for resume_card in self.iter_resume_cards()]
+        return results_dict(resume_cards, self.warnings, self.failed_pages)
@@ -0,0 +1,309 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from scraping.cache import make_cache_key, normalize_filter_value
+from scraping.cities import find_work_ua_city_slug, normalize_city_name
+from scraping.metrics import metrics
+from scraping.records import Resume
+
+load_dotenv()
+
+SALARY_PATTERN = re.compile(r"\d[\d\s  ]*")
+WORD_PATTERN = re.compile(r"\w+")
+# symbols are kept, "C++", "C#" and ".NET" are different searches
+POSITION_TOKEN_PATTERN = re.compile(r"[^\s,;]+")
+# tokens the full-text tokenizer keeps whole, only these can narrow an indexed search
+PLAIN_WORD_PATTERN = re.compile(r"[^\W_]+")
+# bumped when stored searches can't be compared with new ones anymore
+SCHEMA_VERSION = 1
+# filters the site searched by, resumes don't carry them themselves
+SEARCH_FILTERS = ("job_position", "location", "work_experience", "employment_type")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS resumes (
+    id INTEGER PRIMARY KEY,
+    link TEXT NOT NULL UNIQUE,
+    site TEXT NOT NULL,
+    occupation TEXT,
+    skills TEXT,
+    city TEXT,
+    salary INTEGER,
+    updated_at TEXT,
+    indexed_at REAL NOT NULL,
+    info TEXT NOT NULL
+);
+-- resumes are only read through search_results, files of older versions still have this index
+DROP INDEX IF EXISTS resumes_city_salary;
+CREATE INDEX IF NOT EXISTS resumes_indexed_at ON resumes (indexed_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS resumes_fts USING fts5(
+    occupation, skills, content='resumes', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS resumes_fts_insert AFTER INSERT ON resumes BEGIN
+    INSERT INTO resumes_fts (rowid, occupation, skills) VALUES (new.id, new.occupation, new.skills);
+END;
+CREATE TRIGGER IF NOT EXISTS resumes_fts_delete AFTER DELETE ON resumes BEGIN
+    INSERT INTO resumes_fts (resumes_fts, rowid, occupation, skills)
+    VALUES ('delete', old.id, old.occupation, old.skills);
+END;
+CREATE TRIGGER IF NOT EXISTS resumes_fts_update AFTER UPDATE OF occupation, skills ON resumes BEGIN
+    INSERT INTO resumes_fts (resumes_fts, rowid, occupation, skills)
+    VALUES ('delete', old.id, old.occupation, old.skills);
+    INSERT INTO resumes_fts (rowid, occupation, skills) VALUES (new.id, new.occupation, new.skills);
+END;
+CREATE TABLE IF NOT EXISTS indexed_searches (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    site TEXT NOT NULL,
+    position TEXT NOT NULL,
+    city TEXT,
+    experience TEXT,
+    employment_type TEXT,
+    salary_from INTEGER,
+    salary_to INTEGER,
+    total_resumes INTEGER,
+    exhaustive INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS indexed_searches_filters ON indexed_searches (site, city, experience, employment_type);
+CREATE TABLE IF NOT EXISTS search_results (
+    search_id INTEGER NOT NULL,
+    rank INTEGER NOT NULL,
+    resume_id INTEGER NOT NULL,
+    PRIMARY KEY (search_id, rank)
+) WITHOUT ROWID;
+"""
+
+
+def parse_salary(text) -> int | None:
+    match = SALARY_PATTERN.search(str(text or ""))
+    return int(re.sub(r"\D", "", match.group())) if match else None
+
+
+def canonical_city(location: str | None) -> str | None:
+    """
+    Same city spelled differently ("Київ", "Kyiv") is stored once, None is whole Ukraine
+    """
+    if not location:
+        return None
+    city_slug = find_work_ua_city_slug(location)
+    if city_slug == "":
+        return None
+    return city_slug if city_slug is not None else normalize_city_name(location)
+
+
+def position_words(position: str | None) -> list[str]:
+    return WORD_PATTERN.findall((position or "").lower())
+
+
+def position_tokens(position: str | None) -> list[str]:
+    return POSITION_TOKEN_PATTERN.findall((position or "").lower())
+
+
+def fts_query(words: list[str]) -> str:
+    """
+    Every word has to be in occupation or skills, prefixes match word endings
+    """
+    return " ".join(f'"{word}"*' for word in words)
+
+
+class ResumeIndex:
+    """
+    Local index of scraped resumes, answers repeated searches without going to the site.
+    A search is answered if the same search (salary aside) was scraped not longer than `max_age` ago,
+    or if a broader one was scraped to the end, e.g. all of "python" answers "python django".
+    Older results are kept for `keep_for` seconds to answer while the site is down
+    """
+
+    def __init__(self, path: str, max_age: float, keep_for: float) -> None:
+        self.path = path
+        self.max_age = max_age
+        self.keep_for = max(keep_for, max_age)
+        self._database: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        self._pruned_at = time.time()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # opened on first use under the lock, importing the module doesn't create the file
+        if self._database is None:
+            self._database = sqlite3.connect(self.path, check_same_thread=False)
+            self._database.execute("PRAGMA journal_mode = WAL")
+            self._database.execute("PRAGMA synchronous = NORMAL")
+            self._database.executescript(SCHEMA)
+            if self._database.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # older searches stored positions without symbols, "C++" as "c"
+                self._database.executescript(
+                    "DELETE FROM search_results; DELETE FROM indexed_searches; "
+                    f"PRAGMA user_version = {SCHEMA_VERSION};"
+                )
+        return self._database
+
+    @staticmethod
+    def search_key(site: str, filters: dict) -> str:
+        return make_cache_key(site, {name: filters.get(name) for name in SEARCH_FILTERS})
+
+    def add(self, site: str, filters: dict, resume_cards: list[Resume], total_resumes: int | None,
+            exhaustive: bool) -> None:
+        """
+        Stores cards found by the search in the site's order,
+        `exhaustive` tells that the search has no more cards than these
+        """
+        indexed_at = time.time()
+        city = canonical_city(filters.get("location"))
+        rows = []
+        for resume_card in resume_cards:
+            skills = (resume_card.details or {}).get("skills") or []
+            rows.append((
+                resume_card.link,
+                site,
+                resume_card.candidate_occupation,
+                ", ".join(skills),
+                # cards of a city search may show nearby or remote cities, they still answer that search
+                city or canonical_city(resume_card.candidate_city),
+                parse_salary(resume_card.candidate_salary),
+                resume_card.updated_at,
+                indexed_at,
+                json.dumps(resume_card.as_row(), ensure_ascii=False),
+            ))
+
+        with self._lock, self._connection:
+            resume_ids = [
+                self._connection.execute(
+                    "INSERT INTO resumes (link, site, occupation, skills, city, salary, updated_at, indexed_at, info) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                    "ON CONFLICT (link) DO UPDATE SET occupation = excluded.occupation, "
+                    "skills = CASE WHEN excluded.skills != '' THEN excluded.skills ELSE resumes.skills END, "
+                    "city = excluded.city, salary = excluded.salary, updated_at = excluded.updated_at, "
+                    "indexed_at = excluded.indexed_at, info = excluded.info "
+                    "RETURNING id",
+                    row,
+                ).fetchone()[0]
+                for row in rows
+            ]
+            search_id = self._connection.execute(
+                "INSERT INTO indexed_searches (key, site, position, city, experience, employment_type, salary_from, "
+                "salary_to, total_resumes, exhaustive, indexed_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET salary_from = excluded.salary_from, salary_to = excluded.salary_to, "
+                "total_resumes = excluded.total_resumes, exhaustive = excluded.exhaustive, "
+                "indexed_at = excluded.indexed_at "
+                "RETURNING id",
+                (self.search_key(site, filters), site, " ".join(position_tokens(filters.get("job_position"))), city,
+                 normalize_filter_value(filters.get("work_experience")),
+                 normalize_filter_value(filters.get("employment_type")), filters.get("salary_from"),
+                 filters.get("salary_to"), total_resumes, exhaustive, indexed_at),
+            ).fetchone()[0]
+            self._connection.execute("DELETE FROM search_results WHERE search_id = ?", (search_id,))
+            self._connection.executemany(
+                "INSERT INTO search_results (search_id, rank, resume_id) VALUES (?, ?, ?)",
+                [(search_id, rank, resume_id) for rank, resume_id in enumerate(resume_ids)],
+            )
+        if indexed_at - self._pruned_at > self.max_age:
+            self._pruned_at = indexed_at
+            self.prune()
+
+    @staticmethod
+    def covers_salary(salary_from, salary_to, filters: dict) -> bool:
+        """
+        Tells if the indexed salary range contains the asked one, empty bounds are open
+        """
+        asked_from, asked_to = filters.get("salary_from") or 0, filters.get("salary_to") or 0
+        if asked_from < (salary_from or 0):
+            return False
+        return not salary_to or 0 < asked_to <= salary_to
+
+    def find_covering_search(self, site: str, filters: dict, max_age: float) -> tuple | None:
+        """
+        Returns (id, total_resumes, exhaustive, narrower) of a fresh indexed search that contains the asked one
+        """
+        fresh_since = time.time() - max_age
+        row = self._connection.execute(
+            "SELECT id, total_resumes, exhaustive, salary_from, salary_to FROM indexed_searches "
+            "WHERE key = ? AND indexed_at >= ?",
+            (self.search_key(site, filters), fresh_since),
+        ).fetchone()
+        if row is not None and self.covers_salary(row[3], row[4], filters):
+            return row[0], row[1], row[2], False
+
+        asked_words = set(position_tokens(filters.get("job_position")))
+        if not all(PLAIN_WORD_PATTERN.fullmatch(word) for word in asked_words):
+            # full-text search would split "c++" or ".net" into other words, only the site can answer
+            return None
+        candidates = self._connection.execute(
+            "SELECT id, total_resumes, position, salary_from, salary_to FROM indexed_searches "
+            "WHERE site = ? AND city IS ? AND experience IS ? AND employment_type IS ? "
+            "AND exhaustive AND indexed_at >= ?",
+            (site, canonical_city(filters.get("location")), normalize_filter_value(filters.get("work_experience")),
+             normalize_filter_value(filters.get("employment_type")), fresh_since),
+        ).fetchall()
+        for search_id, total_resumes, position, salary_from, salary_to in candidates:
+            if set(position.split()) < asked_words and self.covers_salary(salary_from, salary_to, filters):
+                return search_id, total_resumes, True, True
+        return None
+
+    def search(self, site: str, filters: dict, limit: int,
+               max_age: float | None = None) -> tuple[list[Resume], int] | None:
+        """
+        Returns `limit` cards matching the filters in the site's order and the total count,
+        or None if the index doesn't have fresh enough data to answer.
+        `max_age` overrides the index's own one, e.g. to answer with older data while the site is down
+        """
+        with self._lock:
+            covering_search = self.find_covering_search(site, filters, self.max_age if max_age is None else max_age)
+            if covering_search is None:
+                return None
+            search_id, total_resumes, exhaustive, narrower = covering_search
+
+            conditions, params = ["search_results.search_id = ?"], [search_id]
+            if filters.get("salary_from"):
+                conditions.append("(resumes.salary IS NULL OR resumes.salary >= ?)")
+                params.append(filters["salary_from"])
+            if filters.get("salary_to"):
+                conditions.append("(resumes.salary IS NULL OR resumes.salary <= ?)")
+                params.append(filters["salary_to"])
+            if narrower:
+                conditions.append("resumes.id IN (SELECT rowid FROM resumes_fts WHERE resumes_fts MATCH ?)")
+                params.append(fts_query(position_words(filters.get("job_position"))))
+            query = ("FROM search_results JOIN resumes ON resumes.id = search_results.resume_id "
+                     f"WHERE {' AND '.join(conditions)}")
+
+            rows = self._connection.execute(
+                f"SELECT info {query} ORDER BY search_results.rank LIMIT ?", (*params, limit)
+            ).fetchall()
+            if not exhaustive and len(rows) < limit:
+                # the site may have more matching cards than were indexed
+                return None
+            if exhaustive:
+                total_resumes = self._connection.execute(f"SELECT COUNT(*) {query}", params).fetchone()[0]
+
+        metrics.increment("resume_index_hits_total", site=site)
+        return [Resume.from_row(json.loads(info)) for info, in rows], total_resumes
+
+    def prune(self) -> None:
+        """
+        Drops searches and resumes that are too old to answer anything, even while the site is down
+        """
+        stale_since = time.time() - self.keep_for
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM search_results WHERE search_id IN (SELECT id FROM indexed_searches WHERE indexed_at < ?)",
+                (stale_since,),
+            )
+            self._connection.execute("DELETE FROM indexed_searches WHERE indexed_at < ?", (stale_since,))
+            self._connection.execute("DELETE FROM resumes WHERE indexed_at < ?", (stale_since,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM resumes").fetchone()[0]
+
+
+resume_index = ResumeIndex(
+    os.getenv("RESUME_INDEX_PATH", "resume_index.db"),
+    max_age=float(os.getenv("RESUME_INDEX_MAX_AGE", 60 * 60)),
+    keep_for=float(os.getenv("RESUME_INDEX_KEEP_FOR", 7 * 24 * 60 * 60)),
+)
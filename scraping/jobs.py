@@ -0,0 +1,546 @@
+import asyncio
+import importlib
+import itertools
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from enum import Enum
+
+from dotenv import load_dotenv
+
+from scraping.metrics import metrics
+from scraping.records import Resume
+
+load_dotenv()
+
+# seconds a finished job is kept for the handler to read its result
+JOB_RESULT_TTL = 300
+# seconds an undelivered result of a shared queue waits for a process to show it
+JOB_UNDELIVERED_TTL = 24 * 60 * 60
+# seconds between checks of the shared job store for new jobs, progress and cancellation
+JOB_POLL_INTERVAL = 1
+
+
+class JobQueueFullError(Exception):
+    """
+    Raised when there are too many searches waiting already
+    """
+
+
+class UserJobLimitError(Exception):
+    """
+    Raised when the user already runs as many searches as allowed
+    """
+
+
+class JobStatus(str, Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+def import_path(path: str):
+    module_name, _, name = path.rpartition(".")
+    return getattr(importlib.import_module(module_name), name)
+
+
+def object_path(obj) -> str:
+    return f"{obj.__module__}.{obj.__qualname__}"
+
+
+def encode_value(value):
+    """
+    JSON form of values passed between processes: job arguments, results and errors
+    """
+    if isinstance(value, Resume):
+        return {"__resume__": value.as_row()}
+    if isinstance(value, type):
+        return {"__class__": object_path(value)}
+    if isinstance(value, BaseException):
+        return {"__error__": object_path(type(value)), "message": str(value)}
+    raise TypeError(f"{type(value).__name__} can't be passed to a job of another process")
+
+
+def decode_value(obj: dict):
+    if "__resume__" in obj:
+        return Resume.from_row(obj["__resume__"])
+    if "__class__" in obj:
+        return import_path(obj["__class__"])
+    if "__error__" in obj:
+        try:
+            return import_path(obj["__error__"])(obj["message"])
+        except (ImportError, AttributeError, TypeError):
+            return RuntimeError(obj["message"])
+    return obj
+
+
+def dump_value(value) -> str:
+    return json.dumps(value, default=encode_value, ensure_ascii=False)
+
+
+def load_value(text: str | None):
+    return None if text is None else json.loads(text, object_hook=decode_value)
+
+
+@dataclass
+class Job:
+    job_id: int
+    user_id: int
+    coroutine_function: object
+    args: tuple = ()
+    kwargs: dict = field(default_factory=dict)
+    status: JobStatus = JobStatus.QUEUED
+    page: int = 0
+    total_pages: int = 0
+    result: object = None
+    error: BaseException | None = None
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: float | None = None
+    finished_at: float | None = None
+    done: asyncio.Event = field(default_factory=asyncio.Event)
+    task: asyncio.Task | None = None
+    cancel_requested: bool = False
+    # where the submitting process shows the progress, lets another process take over after a restart
+    meta: dict = field(default_factory=dict)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JobStatus.DONE, JobStatus.FAILED, JobStatus.CANCELLED)
+
+    def report_progress(self, page: int, total_pages: int) -> None:
+        self.page = page
+        self.total_pages = total_pages
+
+
+class JobStore:
+    """
+    Jobs in a sqlite file shared by every bot process of the host, a job submitted by one process
+    can be run by a worker of any of them
+    """
+
+    columns = ("job_id, user_id, function, kwargs, meta, status, page, total_pages, result, error, "
+               "cancel_requested, created_at, started_at, finished_at")
+
+    def __init__(self, path: str, stale_after: float, max_attempts: int = 3) -> None:
+        self.stale_after = stale_after
+        self.max_attempts = max_attempts
+        # autocommit, the few statements that must not interleave with other processes open a transaction
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._lock = threading.Lock()
+        self._connection.execute("PRAGMA journal_mode = WAL")
+        self._connection.executescript(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, function TEXT NOT NULL, kwargs TEXT NOT NULL, "
+            "meta TEXT NOT NULL, status TEXT NOT NULL, page INTEGER NOT NULL DEFAULT 0, "
+            "total_pages INTEGER NOT NULL DEFAULT 0, result TEXT, error TEXT, "
+            "cancel_requested INTEGER NOT NULL DEFAULT 0, attempts INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+            "owner TEXT NOT NULL, owner_seen_at REAL NOT NULL, delivered INTEGER NOT NULL DEFAULT 0, "
+            "created_at REAL NOT NULL, started_at REAL, finished_at REAL, heartbeat_at REAL);"
+            "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, job_id);"
+        )
+
+    def insert(self, user_id: int, function: str, kwargs: str, meta: str, owner: str, check_limits) -> int:
+        """
+        Adds a queued job, `check_limits(active_jobs_of_user, queued_jobs)` raises if it can't be added
+        """
+        now = time.time()
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                active, queued = self._connection.execute(
+                    "SELECT COUNT(*) FILTER (WHERE user_id = ?), COUNT(*) FILTER (WHERE status = 'queued') "
+                    "FROM jobs WHERE status IN ('queued', 'running')",
+                    (user_id,),
+                ).fetchone()
+                check_limits(active, queued)
+                job_id = self._connection.execute(
+                    "INSERT INTO jobs (user_id, function, kwargs, meta, status, owner, owner_seen_at, created_at) "
+                    "VALUES (?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (user_id, function, kwargs, meta, owner, now, now),
+                ).lastrowid
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return job_id
+
+    def claim(self, worker: str) -> tuple | None:
+        """
+        Marks the oldest queued job as running by `worker`, returns its row
+        """
+        now = time.time()
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, started_at = ?, heartbeat_at = ?, "
+                "attempts = attempts + 1 "
+                "WHERE job_id = (SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY job_id LIMIT 1) "
+                f"AND status = 'queued' RETURNING {self.columns}",
+                (worker, now, now),
+            ).fetchone()
+
+    def heartbeat(self, job_id: int, page: int, total_pages: int) -> bool:
+        """
+        Saves progress of a running job, returns True if its cancellation was asked for
+        """
+        with self._lock:
+            row = self._connection.execute(
+                "UPDATE jobs SET page = ?, total_pages = ?, heartbeat_at = ? WHERE job_id = ? "
+                "RETURNING cancel_requested",
+                (page, total_pages, time.time(), job_id),
+            ).fetchone()
+        return bool(row and row[0])
+
+    def finish(self, job_id: int, status: str, result: str | None, error: str | None) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE job_id = ?",
+                (status, result, error, time.time(), job_id),
+            )
+
+    def release(self, job_id: int) -> None:
+        """
+        Puts a job back to the queue, its worker is stopping
+        """
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL WHERE job_id = ? AND status = 'running'", (job_id,)
+            )
+
+    def load(self, job_id: int, owner: str | None = None) -> tuple | None:
+        """
+        Returns the job's row, the owner reading it is remembered as alive
+        """
+        with self._lock:
+            if owner is not None:
+                self._connection.execute(
+                    "UPDATE jobs SET owner_seen_at = ? WHERE job_id = ? AND owner = ?", (time.time(), job_id, owner)
+                )
+            return self._connection.execute(f"SELECT {self.columns} FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+
+    def position(self, job_id: int) -> int:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND job_id < ?", (job_id,)
+            ).fetchone()[0]
+
+    def cancel(self, job_id: int) -> bool:
+        """
+        Queued job is cancelled at once, running one is cancelled by its worker on the next heartbeat
+        """
+        with self._lock:
+            return self._connection.execute(
+                "UPDATE jobs SET cancel_requested = 1, "
+                "finished_at = CASE WHEN status = 'queued' THEN ? ELSE finished_at END, "
+                "status = CASE WHEN status = 'queued' THEN 'cancelled' ELSE status END "
+                "WHERE job_id = ? AND status IN ('queued', 'running')",
+                (time.time(), job_id),
+            ).rowcount > 0
+
+    def mark_delivered(self, job_id: int) -> None:
+        with self._lock:
+            self._connection.execute("UPDATE jobs SET delivered = 1 WHERE job_id = ?", (job_id,))
+
+    def recover(self) -> None:
+        """
+        Requeues jobs of workers that stopped sending heartbeats, jobs that took down too many workers fail
+        """
+        stale_since = time.time() - self.stale_after
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET worker = NULL, "
+                "status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END, "
+                "finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END "
+                "WHERE status = 'running' AND heartbeat_at < ?",
+                (self.max_attempts, self.max_attempts, time.time(), stale_since),
+            )
+
+    def adopt(self, owner: str) -> list[int]:
+        """
+        Takes over undelivered jobs of processes that stopped reading them, returns their ids
+        """
+        now = time.time()
+        with self._lock:
+            rows = self._connection.execute(
+                "UPDATE jobs SET owner = ?, owner_seen_at = ? "
+                "WHERE NOT delivered AND owner != ? AND owner_seen_at < ? RETURNING job_id",
+                (owner, now, owner, now - self.stale_after),
+            ).fetchall()
+        return [job_id for job_id, in rows]
+
+    def prune(self) -> None:
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE finished_at < ? AND (delivered OR finished_at < ?)",
+                (now - JOB_RESULT_TTL, now - JOB_UNDELIVERED_TTL),
+            )
+
+    @staticmethod
+    def update_job(job: Job, row: tuple) -> Job:
+        (_, _, _, _, meta, status, page, total_pages, result, error, cancel_requested,
+         created_at, started_at, finished_at) = row
+        job.meta = json.loads(meta)
+        job.status = JobStatus(status)
+        job.page, job.total_pages = page, total_pages
+        job.cancel_requested = bool(cancel_requested)
+        job.created_at, job.started_at, job.finished_at = created_at, started_at, finished_at
+        if job.finished and not job.done.is_set():
+            job.result = load_value(result)
+            job.error = load_value(error)
+            job.done.set()
+        return job
+
+    def row_to_job(self, row: tuple) -> Job:
+        job_id, user_id, function, kwargs = row[:4]
+        return self.update_job(Job(job_id=job_id, user_id=user_id, coroutine_function=function,
+                                   kwargs=load_value(kwargs)), row)
+
+
+class JobQueue:
+    """
+    Bounded queue of scraping jobs processed by a fixed number of workers,
+    so update handlers only submit searches and poll their status.
+    With a `store` the queue is shared by all processes using the same store,
+    its sqlite calls run in threads so a busy store doesn't stall the event loop
+    """
+
+    def __init__(self, workers: int, max_queued: int, per_user_limit: int, store: JobStore | None = None) -> None:
+        self.workers = workers
+        self.max_queued = max_queued
+        self.per_user_limit = per_user_limit
+        self.store = store
+        # tells this process apart from the other ones sharing the store
+        self.process_id = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self.jobs: dict[int, Job] = {}
+        self._queue: asyncio.Queue[Job] | None = None
+        self._worker_tasks: list[asyncio.Task] = []
+        self._active_by_user: defaultdict[int, int] = defaultdict(int)
+        self._job_ids = itertools.count(1)
+
+    async def start(self) -> None:
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queued)
+        work = self._work_shared if self.store else self._work
+        self._worker_tasks = [asyncio.create_task(work()) for _ in range(self.workers)]
+
+    async def close(self) -> None:
+        if not self.store:
+            # jobs of a shared queue are left to the other processes
+            for job in list(self.jobs.values()):
+                await self.cancel(job.job_id)
+        for worker_task in self._worker_tasks:
+            worker_task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+
+    def check_limits(self, user_id: int, active_jobs: int, queued_jobs: int) -> None:
+        if active_jobs >= self.per_user_limit:
+            raise UserJobLimitError("You already have a search running, wait for it to finish or cancel it")
+        if queued_jobs >= self.max_queued:
+            raise JobQueueFullError("Too many searches are running right now, please try again in a minute")
+
+    async def submit(self, user_id: int, coroutine_function, *args, meta: dict | None = None, **kwargs) -> Job:
+        """
+        Queues `coroutine_function(*args, progress=job.report_progress, **kwargs)` for the user.
+        Jobs of a shared queue take keyword arguments only, they are passed to another process as JSON
+        """
+        if self._queue is None:
+            raise RuntimeError("Job queue is not started")
+        if self.store:
+            job_id = await asyncio.to_thread(
+                self.store.insert,
+                user_id, object_path(coroutine_function), dump_value(kwargs), json.dumps(meta or {}), self.process_id,
+                lambda active_jobs, queued_jobs: self.check_limits(user_id, active_jobs, queued_jobs),
+            )
+            job = Job(job_id=job_id, user_id=user_id, coroutine_function=coroutine_function, kwargs=kwargs,
+                      meta=meta or {})
+            self.jobs[job_id] = job
+            return job
+
+        self.check_limits(user_id, self._active_by_user[user_id], self._queue.qsize())
+        job = Job(job_id=next(self._job_ids), user_id=user_id, coroutine_function=coroutine_function,
+                  args=args, kwargs=kwargs, meta=meta or {})
+        self._queue.put_nowait(job)
+        self.jobs[job.job_id] = job
+        self._active_by_user[user_id] += 1
+        return job
+
+    async def get(self, job_id: int) -> Job | None:
+        if self.store:
+            row = await asyncio.to_thread(self.store.load, job_id)
+            if row is None:
+                return None
+            job = self.jobs.get(job_id)
+            return self.store.update_job(job, row) if job else self.store.row_to_job(row)
+        return self.jobs.get(job_id)
+
+    async def position(self, job_id: int) -> int:
+        """
+        Number of queued jobs ahead of the job, 0 if it is already running
+        """
+        job = self.jobs.get(job_id)
+        if job is None or job.status != JobStatus.QUEUED:
+            return 0
+        if self.store:
+            return await asyncio.to_thread(self.store.position, job_id)
+        return sum(1 for other in self.jobs.values()
+                   if other.status == JobStatus.QUEUED and other.job_id < job_id)
+
+    async def cancel(self, job_id: int) -> bool:
+        if self.store:
+            return await asyncio.to_thread(self.store.cancel, job_id)
+        job = self.jobs.get(job_id)
+        if job is None or job.finished:
+            return False
+        job.cancel_requested = True
+        if job.task is not None:
+            job.task.cancel()
+        else:
+            # not picked up by a worker yet, worker will skip it
+            self._finish(job, JobStatus.CANCELLED)
+        return True
+
+    async def wait(self, job_id: int, timeout: float | None = None) -> Job:
+        """
+        Waits for the job to finish, raises asyncio.TimeoutError after `timeout` seconds
+        """
+        if not self.store:
+            job = self.jobs[job_id]
+            await asyncio.wait_for(job.done.wait(), timeout)
+            return job
+
+        job = self.jobs.get(job_id) or await self.get(job_id)
+        if job is None:
+            raise KeyError(job_id)
+        self.jobs[job_id] = job
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            row = await asyncio.to_thread(self.store.load, job_id, self.process_id)
+            if row is None:
+                raise KeyError(job_id)
+            self.store.update_job(job, row)
+            if job.finished:
+                return job
+            if deadline is not None and time.monotonic() >= deadline:
+                raise asyncio.TimeoutError
+            await asyncio.sleep(JOB_POLL_INTERVAL if deadline is None
+                                else min(JOB_POLL_INTERVAL, deadline - time.monotonic()))
+
+    async def mark_delivered(self, job_id: int) -> None:
+        """
+        Tells the other processes the job's result was shown, nobody has to take it over
+        """
+        if self.store:
+            await asyncio.to_thread(self.store.mark_delivered, job_id)
+            self.jobs.pop(job_id, None)
+
+    async def adopt_jobs(self) -> list[Job]:
+        """
+        Jobs submitted by processes that are gone, their progress and results should be shown by this one
+        """
+        if not self.store:
+            return []
+        job_ids = await asyncio.to_thread(self.store.adopt, self.process_id)
+        jobs = [job for job in [await self.get(job_id) for job_id in job_ids] if job is not None]
+        self.jobs.update((job.job_id, job) for job in jobs)
+        return jobs
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                if job.finished:
+                    continue
+                job.status = JobStatus.RUNNING
+                job.started_at = time.monotonic()
+                metrics.observe("job_queue_wait", job.started_at - job.created_at)
+                job.task = asyncio.create_task(
+                    job.coroutine_function(*job.args, progress=job.report_progress, **job.kwargs)
+                )
+                try:
+                    job.result = await job.task
+                except asyncio.CancelledError:
+                    self._finish(job, JobStatus.CANCELLED)
+                    if not job.cancel_requested:
+                        # the worker itself is being stopped
+                        raise
+                except Exception as error:  # noqa: B902 job failures are reported through the job status
+                    job.error = error
+                    self._finish(job, JobStatus.FAILED)
+                else:
+                    self._finish(job, JobStatus.DONE)
+            finally:
+                self._queue.task_done()
+
+    async def _work_shared(self) -> None:
+        while True:
+            row = await asyncio.to_thread(self.store.claim, self.process_id)
+            if row is None:
+                # idle workers look after jobs of crashed processes
+                await asyncio.to_thread(self.store.recover)
+                await asyncio.to_thread(self.store.prune)
+                await asyncio.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            job = self.store.row_to_job(row)
+            metrics.observe("job_queue_wait", job.started_at - job.created_at)
+            job.task = asyncio.create_task(
+                import_path(job.coroutine_function)(progress=job.report_progress, **job.kwargs)
+            )
+            heartbeat = asyncio.create_task(self._heartbeat(job))
+            status, result, error = JobStatus.DONE, None, None
+            try:
+                result = await job.task
+            except asyncio.CancelledError:
+                if not job.cancel_requested:
+                    # the worker itself is being stopped, another process will run the job
+                    await asyncio.to_thread(self.store.release, job.job_id)
+                    raise
+                status = JobStatus.CANCELLED
+            except Exception as job_error:  # noqa: B902 job failures are reported through the job status
+                status, error = JobStatus.FAILED, job_error
+            finally:
+                heartbeat.cancel()
+            metrics.increment("jobs_total", status=status.value)
+            await asyncio.to_thread(self.store.finish, job.job_id, status.value, dump_value(result),
+                                    None if error is None else dump_value(error))
+
+    async def _heartbeat(self, job: Job) -> None:
+        while True:
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+            if await asyncio.to_thread(self.store.heartbeat, job.job_id, job.page, job.total_pages):
+                job.cancel_requested = True
+                job.task.cancel()
+                return
+
+    def _finish(self, job: Job, status: JobStatus) -> None:
+        if job.finished:
+            return
+        job.status = status
+        job.finished_at = time.monotonic()
+        metrics.increment("jobs_total", status=status.value)
+        self._active_by_user[job.user_id] -= 1
+        job.done.set()
+        asyncio.get_running_loop().call_later(JOB_RESULT_TTL, self.jobs.pop, job.job_id, None)
+
+
+job_queue_path = os.getenv("JOB_QUEUE_PATH")
+job_queue = JobQueue(
+    workers=int(os.getenv("SCRAPE_WORKERS", 4)),
+    max_queued=int(os.getenv("SCRAPE_QUEUE_SIZE", 50)),
+    per_user_limit=int(os.getenv("SCRAPE_JOBS_PER_USER", 1)),
+    store=JobStore(job_queue_path, stale_after=float(os.getenv("JOB_STALE_AFTER", 60))) if job_queue_path else None,
+)
+metrics.register_gauges("job_queue", lambda: {
+    "queued": sum(1 for job in job_queue.jobs.values() if job.status == JobStatus.QUEUED),
+    "running": sum(1 for job in job_queue.jobs.values() if job.status == JobStatus.RUNNING),
+})
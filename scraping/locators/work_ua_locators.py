@@ -7,3 +7,29 @@ SUBMIT_BUTTON = (By.CSS_SELECTOR, "button[type='submit']")
 RESUMES_NOT_FOUND = (By.CSS_SELECTOR, "p > b > span.wordwrap.text-muted")
 FILTERS_BLOCK = (By.CSS_SELECTOR, "div#filter-wrapper div#filters-block")
 RESUME_PAGINATION = (By.CSS_SELECTOR, "nav ul.pagination")
+RESUME_CARD_LINK = (By.CSS_SELECTOR, "h2.cut-top a")
+RESUME_CARD_NAME = (By.CSS_SELECTOR, "p.add-top-xs.cut-bottom > span.strong-600")
+PAGINATION_LINKS = (By.CSS_SELECTOR, "li a")
+# "Знайдено 1 234 резюме" counter above the results, matched against page text
+RESUMES_FOUND_PATTERN = r"(?:Знайдено|Найдено|Found)\s+([\d\s ]+?)\s+(?:резюме|resumes?)"
+RESUME_CARD_AGE = (By.CSS_SELECTOR, "p.add-top-xs.cut-bottom > span:nth-of-type(2)")
+RESUME_CARD_CITY = (By.CSS_SELECTOR, "p.add-top-xs.cut-bottom > span:nth-of-type(3)")
+RESUME_CARD_SALARY = (By.CSS_SELECTOR, "h2.cut-top + span.strong-600")
+RESUME_CARD_UPDATED = (By.CSS_SELECTOR, "time")
+
+# fields of a resume card extracted in one go, name: (locator inside the card, attribute or "text")
+RESUME_CARD_FIELDS = {
+    "href": (RESUME_CARD_LINK, "href"),
+    "candidate_occupation": (RESUME_CARD_LINK, "text"),
+    "candidate_name": (RESUME_CARD_NAME, "text"),
+    "candidate_age": (RESUME_CARD_AGE, "text"),
+    "candidate_city": (RESUME_CARD_CITY, "text"),
+    "candidate_salary": (RESUME_CARD_SALARY, "text"),
+    "updated_at": (RESUME_CARD_UPDATED, "datetime"),
+}
+
+# resume page
+RESUME_SKILLS = (By.CSS_SELECTOR, "ul.list-unstyled li.no-style span.ellipsis")
+RESUME_EXPERIENCE_POSITION = (By.CSS_SELECTOR, "h2.h4.strong-600")
+RESUME_SALARY_EXPECTATION = (By.CSS_SELECTOR, "h2.mt-sm span.text-muted-print")
+RESUME_UPDATED = (By.CSS_SELECTOR, "time")
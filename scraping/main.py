@@ -1,16 +1,227 @@
+import asyncio
+import functools
+import itertools
+import logging
+import os
+from contextlib import aclosing, asynccontextmanager
+
+from scraping.cache import make_cache_key, result_cache
+from scraping.details import detail_fetcher
+from scraping.driver_pool import driver_pool
+from scraping.governor import SiteUnavailableError
+from scraping.http_scrapers import RobotaUaScraper, WorkUaHttpScraper
+from scraping.index import resume_index
+from scraping.metrics import metrics
+from scraping.ranking import RANKING_POOL_SIZE, rank_resumes
+from scraping.records import Resume, dump_resumes, load_resumes
+from scraping.scrapers import WorkUaScraper, partial_results_warning
+
+logger = logging.getLogger(__name__)
+
 RESUME_DISPLAY_COUNT = 5
 
+# "all sites" search answers with what is ready after this many seconds
+ALL_SITES_LATENCY_BUDGET = float(os.getenv("ALL_SITES_LATENCY_BUDGET", 20))
+SITE_TIMEOUTS = {
+    "work.ua": float(os.getenv("WORK_UA_TIMEOUT", 20)),
+    "robota.ua": float(os.getenv("ROBOTA_UA_TIMEOUT", 20)),
+}
+
+
+# browserless engines that are tried before falling back to selenium
+HTTP_ENGINES = {
+    WorkUaScraper: WorkUaHttpScraper,
+    RobotaUaScraper: RobotaUaScraper,
+}
+# scraper of every supported site by its name
+PARSER_CLASSES = {parser_class.site_name: parser_class for parser_class in HTTP_ENGINES}
+
+
+async def collect_resumes(parser, limit: int, progress=None) -> dict:
+    """
+    Takes first `limit` cards from the parser's lazy stream and the cheap total count,
+    so no more pages are loaded than needed to show the cards.
+    `progress(page, total_pages)` is called whenever the parser moves to another page
+    """
+    resume_cards = []
+    reported_page = 0
+    async with aclosing(parser.iter_resume_cards(limit)) as resume_stream:
+        async for resume_card in resume_stream:
+            if progress and parser.current_page != reported_page:
+                reported_page = parser.current_page
+                progress(reported_page, parser.total_pages)
+            resume_cards.append(resume_card)
+            if len(resume_cards) >= limit:
+                break
+    total_resumes = await parser.count_resumes()
+    warnings = list(parser.warnings)
+    if parser.failed_pages:
+        warnings.append(partial_results_warning(parser.failed_pages))
+    return {
+        "resume_cards": resume_cards,
+        "total_resumes": total_resumes,
+        "warnings": warnings,
+        "complete": not parser.failed_pages,
+    }
+
+
+async def parse_resumes(parser_class, filters: dict, limit: int = RESUME_DISPLAY_COUNT, details: bool = False,
+                        progress=None):
+    """
+    Returns all collected cards best first, `limit` of them are shown at once.
+    With `details` the first `limit` cards also get skills, experience and salary expectation from the resume page
+    """
+    site = parser_class.site_name
+    with metrics.span("search", site=site):
+        cache_key = make_cache_key(site, filters, limit=limit, details=details)
+        with metrics.span("cache_lookup", site=site):
+            cached_result = await result_cache.get(cache_key)
+        if cached_result is not None:
+            resume_cards, total_resume_amount, warning = cached_result
+            return load_resumes(resume_cards), total_resume_amount, warning
+
+        # more cards than shown are collected, so the best of them can be picked
+        pool_size = max(limit, RANKING_POOL_SIZE)
+        with metrics.span("index_lookup", site=site):
+            indexed = await asyncio.to_thread(resume_index.search, site, filters, pool_size)
+        if indexed is not None:
+            resume_pool, total_resume_amount = indexed
+            warning, complete = None, True
+        else:
+            resume_pool, total_resume_amount, warning, complete = await scrape_resumes(parser_class, filters,
+                                                                                       pool_size, progress)
+
+        with metrics.span("ranking", site=site):
+            # all cards are kept for paging, so the whole pool is ranked
+            resume_cards = rank_resumes(resume_pool, filters)
+        if details:
+            with metrics.span("resume_details_stage", site=site):
+                await detail_fetcher.add_details(HTTP_ENGINES[parser_class](), resume_cards[:limit])
+        if indexed is None and complete and not warning:
+            # fewer cards than asked for means the site has no more of them
+            await asyncio.to_thread(resume_index.add, site, filters, resume_pool, total_resume_amount,
+                                    len(resume_pool) < pool_size)
+        if complete:
+            await result_cache.set(cache_key, [dump_resumes(resume_cards), total_resume_amount, warning], site)
+        return resume_cards, total_resume_amount, warning
+
+
+@asynccontextmanager
+async def open_search(parser_class, filters: dict):
+    """
+    Yields a parser of the site with the first result page loaded, the browser is used only
+    when the site has no browserless engine or it can't handle the search
+    """
+    site = parser_class.site_name
+    http_engine = HTTP_ENGINES.get(parser_class)
+    if http_engine:
+        parser = http_engine()
+        with metrics.span("first_page", site=site, engine="http"):
+            opened = await parser.open_search(filters=filters)
+        if opened:
+            yield parser
+            return
+        if getattr(parser_class, "browserless", False):
+            raise SiteUnavailableError(f"{site} is unavailable right now, please try again later")
+        metrics.increment("selenium_fallbacks_total", site=site)
 
-async def parse_resumes(parser_class, filters: dict):
-    parser = parser_class()
-    # TODO: make method universal, not only for work ua
-    await parser.find_resumes_without_filters(filters=filters)
-    await parser.apply_filters(filters=filters)
-    result = await parser.parse_resumes()
+    async with driver_pool.lease() as driver:
+        # idle sessions help to load next result pages in parallel
+        parser = parser_class(driver=driver, spare_drivers=driver_pool.lease_idle)
+        with metrics.span("first_page", site=site, engine="selenium"):
+            await parser.navigate_to_results(filters=filters)
+        yield parser
+
+
+async def scrape_resumes(parser_class, filters: dict, limit: int, progress=None):
+    """
+    Scrapes the site, the last returned value tells if no result pages were lost
+    """
+    site = parser_class.site_name
+    try:
+        async with open_search(parser_class, filters) as parser:
+            with metrics.span("collect_resumes", site=site):
+                result = await collect_resumes(parser, limit, progress)
+    except SiteUnavailableError as error:
+        # resumes found while the site was up are better than nothing, the index keeps them for a while
+        stale = await asyncio.to_thread(resume_index.search, site, filters, limit, resume_index.keep_for)
+        if stale is not None:
+            metrics.increment("stale_results_served_total", site=site)
+            resume_cards, total_resume_amount = stale
+            return resume_cards, total_resume_amount, f"{site} is unavailable, showing resumes found earlier", False
+        result = {"resume_cards": [], "total_resumes": 0, "warnings": [str(error)], "complete": False}
     total_resume_amount = result.get("total_resumes")
-    resume_cards = result.get("resume_cards")[:RESUME_DISPLAY_COUNT]  # limit resume count
-    # TODO: change warning return if there will be more warnings implemented
-    warning = result.get("city_error_warning")
-    await parser.close_driver()
+    resume_cards = result.get("resume_cards")
+    warning = " ".join(result.get("warnings")) or None
+
+    return resume_cards, total_resume_amount, warning, result.get("complete")
+
+
+def normalize_candidate(resume_card: Resume) -> tuple[str, str]:
+    return tuple(" ".join((value or "").lower().split())
+                 for value in (resume_card.candidate_name, resume_card.candidate_occupation))
+
+
+def merge_resume_cards(resume_card_lists: list[list[Resume]]) -> list[Resume]:
+    """
+    Merges cards of several sites, dropping duplicates by link and by candidate name + occupation
+    """
+    merged, seen_links, seen_candidates = [], set(), set()
+    # take cards of the sites in turns, so the first shown cards are not all from one site
+    for resume_cards in itertools.zip_longest(*resume_card_lists):
+        for resume_card in filter(None, resume_cards):
+            candidate = normalize_candidate(resume_card)
+            if resume_card.link in seen_links or (all(candidate) and candidate in seen_candidates):
+                continue
+            seen_links.add(resume_card.link)
+            seen_candidates.add(candidate)
+            merged.append(resume_card)
+    return merged
+
+
+async def parse_resumes_all_sites(parser_classes, filters: dict, limit: int = RESUME_DISPLAY_COUNT,
+                                  latency_budget: float = ALL_SITES_LATENCY_BUDGET, details: bool = False,
+                                  progress=None):
+    """
+    Runs the search on every site at once and returns whatever finished within `latency_budget` seconds.
+    `progress` gets pages loaded and pages found on all sites together
+    """
+    site_progress = {}
+
+    def report_site_progress(site: str, page: int, total_pages: int) -> None:
+        site_progress[site] = (page, total_pages)
+        if progress:
+            progress(sum(page for page, _ in site_progress.values()),
+                     sum(total_pages for _, total_pages in site_progress.values()))
+
+    async def search_site(parser_class):
+        timeout = SITE_TIMEOUTS.get(parser_class.site_name, latency_budget)
+        site_progress_callback = functools.partial(report_site_progress, parser_class.site_name)
+        return await asyncio.wait_for(parse_resumes(parser_class, filters, limit, details, site_progress_callback),
+                                      timeout)
+
+    tasks = {asyncio.create_task(search_site(parser_class)): parser_class for parser_class in parser_classes}
+    done, pending = await asyncio.wait(tasks, timeout=latency_budget)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    resume_card_lists, total_resume_amount, warnings, skipped_sites = [], 0, [], []
+    # keep site order stable, so the same search shows cards in the same order
+    for task, parser_class in tasks.items():
+        if task not in done or task.exception() is not None:
+            if task in done:
+                logger.warning("Search on %s failed", parser_class.site_name, exc_info=task.exception())
+            skipped_sites.append(parser_class.site_name)
+            continue
+        resume_cards, total_resumes, warning = task.result()
+        resume_card_lists.append(resume_cards)
+        total_resume_amount += total_resumes or 0
+        if warning:
+            warnings.append(f"{parser_class.site_name}: {warning}")
+    if skipped_sites:
+        warnings.append(f"No results from {', '.join(skipped_sites)}, the site is slow or unavailable")
 
-    return resume_cards, total_resume_amount, warning
+    merged_resume_cards = merge_resume_cards(resume_card_lists)
+    resume_cards = rank_resumes(merged_resume_cards, filters)
+    return resume_cards, total_resume_amount, " ".join(warnings) or None
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from aiohttp import web
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# latest samples kept per stage, quantiles are computed over them
+TIMING_WINDOW = 1000
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Metrics:
+    """
+    In-process counters and stage timings of the search pipeline
+    """
+
+    def __init__(self) -> None:
+        self.counters: defaultdict[tuple, float] = defaultdict(float)
+        self.timings: defaultdict[tuple, deque] = defaultdict(lambda: deque(maxlen=TIMING_WINDOW))
+        self.timing_totals: defaultdict[tuple, list[float]] = defaultdict(lambda: [0, 0.0])
+        # callables returning {name: value}, e.g. pool and cache stats
+        self.gauge_sources = {}
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        self.counters[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, stage: str, seconds: float, **labels) -> None:
+        key = (stage, tuple(sorted(labels.items())))
+        self.timings[key].append(seconds)
+        totals = self.timing_totals[key]
+        totals[0] += 1
+        totals[1] += seconds
+
+    @contextmanager
+    def span(self, stage: str, **labels):
+        """
+        Times the block as `stage`, failures are counted separately and still timed
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.increment("stage_failures_total", stage=stage, **labels)
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            self.observe(stage, seconds, **labels)
+            logger.debug("stage %s %s took %.3fs", stage, labels, seconds)
+
+    def register_gauges(self, prefix: str, source) -> None:
+        self.gauge_sources[prefix] = source
+
+    @staticmethod
+    def quantile(sorted_samples: list[float], quantile: float) -> float:
+        index = min(len(sorted_samples) - 1, int(round(quantile * (len(sorted_samples) - 1))))
+        return sorted_samples[index]
+
+    def snapshot(self) -> dict:
+        stages = []
+        for (stage, labels), samples in self.timings.items():
+            sorted_samples = sorted(samples)
+            count, total = self.timing_totals[(stage, labels)]
+            stages.append({
+                "stage": stage,
+                **dict(labels),
+                "count": count,
+                "sum": total,
+                **{f"p{int(quantile * 100)}": self.quantile(sorted_samples, quantile) for quantile in QUANTILES},
+            })
+        counters = [{"name": name, **dict(labels), "value": value} for (name, labels), value in self.counters.items()]
+        gauges = {prefix: source() for prefix, source in self.gauge_sources.items()}
+        return {"time": time.time(), "stages": stages, "counters": counters, "gauges": gauges}
+
+    def prometheus_text(self) -> str:
+        lines = ["# TYPE scrape_stage_seconds summary"]
+        for (stage, labels), samples in self.timings.items():
+            sorted_samples = sorted(samples)
+            stage_labels = (("stage", stage), *labels)
+            for quantile in QUANTILES:
+                quantile_labels = format_labels((*stage_labels, ("quantile", str(quantile))))
+                lines.append(f"scrape_stage_seconds{quantile_labels} {self.quantile(sorted_samples, quantile)}")
+            count, total = self.timing_totals[(stage, labels)]
+            lines.append(f"scrape_stage_seconds_sum{format_labels(stage_labels)} {total}")
+            lines.append(f"scrape_stage_seconds_count{format_labels(stage_labels)} {count}")
+
+        for name in sorted({name for name, _ in self.counters}):
+            lines.append(f"# TYPE {name} counter")
+            for (counter_name, labels), value in self.counters.items():
+                if counter_name == name:
+                    lines.append(f"{name}{format_labels(labels)} {value}")
+
+        for prefix, source in self.gauge_sources.items():
+            for name, value in source().items():
+                lines.append(f"# TYPE {prefix}_{name} gauge")
+                lines.append(f"{prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsExporter:
+    """
+    Serves metrics in Prometheus text format on /metrics and/or dumps JSON snapshots to a file periodically
+    """
+
+    def __init__(self, metrics: Metrics, port: int | None, json_path: str | None, json_interval: float) -> None:
+        self.metrics = metrics
+        self.port = port
+        self.json_path = json_path
+        self.json_interval = json_interval
+        self._runner: web.AppRunner | None = None
+        self._dump_task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        if self.port:
+            app = web.Application()
+            app.router.add_get("/metrics", self.handle_metrics)
+            self._runner = web.AppRunner(app)
+            await self._runner.setup()
+            await web.TCPSite(self._runner, port=self.port).start()
+        if self.json_path:
+            self._dump_task = asyncio.create_task(self.dump_periodically())
+
+    async def close(self) -> None:
+        if self._dump_task:
+            self._dump_task.cancel()
+            await asyncio.gather(self._dump_task, return_exceptions=True)
+            self.dump_json()
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.prometheus_text(), content_type="text/plain")
+
+    def dump_json(self, snapshot: dict | None = None) -> None:
+        snapshot = snapshot or self.metrics.snapshot()
+        with open(self.json_path, "a", encoding="utf-8") as dump_file:
+            dump_file.write(json.dumps(snapshot) + "\n")
+
+    async def dump_periodically(self) -> None:
+        while True:
+            await asyncio.sleep(self.json_interval)
+            # snapshot is taken in the event loop, so metrics don't change while being serialized
+            await asyncio.to_thread(self.dump_json, self.metrics.snapshot())
+
+
+metrics = Metrics()
+
+metrics_exporter = MetricsExporter(
+    metrics,
+    port=int(os.getenv("METRICS_PORT", 0)) or None,
+    json_path=os.getenv("METRICS_JSON_PATH") or None,
+    json_interval=float(os.getenv("METRICS_JSON_INTERVAL", 60)),
+)
@@ -0,0 +1,157 @@
+import heapq
+import math
+import os
+import re
+from datetime import datetime
+
+from dotenv import load_dotenv
+
+from scraping.index import parse_salary, position_words
+from scraping.records import Resume, ResumeBatch
+
+load_dotenv()
+
+# cards collected before ranking, the shown ones are the best of them
+RANKING_POOL_SIZE = int(os.getenv("RANKING_POOL_SIZE", 40))
+RANKING_WEIGHTS = {
+    "position": 0.5,
+    "experience": 0.15,
+    "salary": 0.15,
+    "recency": 0.1,
+    # site's own order, keeps its relevance as a tie breaker
+    "site_order": 0.1,
+}
+# score of a feature the card doesn't have, e.g. salary that isn't shown
+UNKNOWN_SCORE = 0.5
+# days after which recency score drops to ~37%
+RECENCY_DAYS = 30
+# shortest word that counts as matched by a longer one ("develop" in "developer")
+MIN_PREFIX_LENGTH = 4
+# least years of experience for the labels used in filters
+EXPERIENCE_YEARS = {
+    "Without experience": 0,
+    "Up to 1 year": 0,
+    "1-2 years": 1,
+    "2-5 years": 2,
+    "5+ years": 5,
+}
+# "09.2021" on work.ua resume pages, "2021-09" from robota.ua
+MONTH_PATTERN = re.compile(r"(?:(\d{2})\.(\d{4})|(\d{4})-(\d{2}))")
+
+
+def word_match(query_word: str, words: set[str]) -> float:
+    if query_word in words:
+        return 1.0
+    if len(query_word) >= MIN_PREFIX_LENGTH and any(
+        word.startswith(query_word) or (len(word) >= MIN_PREFIX_LENGTH and query_word.startswith(word))
+        for word in words
+    ):
+        return 0.8
+    return 0.0
+
+
+def position_scores(occupations: list[str | None], job_position: str | None) -> list[float]:
+    """
+    Share of the asked position words found in each occupation, a word matched by prefix counts a bit less
+    """
+    query_words = position_words(job_position)
+    if not query_words:
+        return [UNKNOWN_SCORE] * len(occupations)
+    # many cards share an occupation ("Python developer"), each distinct one is scored once
+    occupation_scores = {}
+    for occupation in set(occupations):
+        words = set(position_words(occupation))
+        matched = sum(word_match(query_word, words) for query_word in query_words)
+        occupation_scores[occupation] = matched / len(query_words)
+    return [occupation_scores[occupation] for occupation in occupations]
+
+
+def experience_years(details: dict | None) -> float | None:
+    """
+    Sums experience periods from resume details, ongoing jobs last until now
+    """
+    if not details or not details.get("experience"):
+        return None
+    now = datetime.now()
+    months = 0
+    for experience in details["experience"]:
+        dates = []
+        for month, year, iso_year, iso_month in MONTH_PATTERN.findall(experience.get("period") or ""):
+            dates.append(int(year or iso_year) * 12 + int(month or iso_month))
+        if len(dates) == 1:
+            dates.append(now.year * 12 + now.month)
+        if len(dates) >= 2:
+            months += max(0, dates[1] - dates[0])
+    return months / 12
+
+
+def experience_scores(details_list: list[dict | None], work_experience: str | None) -> list[float]:
+    required_years = EXPERIENCE_YEARS.get(work_experience)
+    scores = []
+    for details in details_list:
+        years = experience_years(details)
+        if years is None or required_years is None:
+            scores.append(UNKNOWN_SCORE)
+        elif required_years == 0 or years >= required_years:
+            scores.append(1.0)
+        else:
+            scores.append(years / required_years)
+    return scores
+
+
+def salary_scores(salaries: list[int | None], salary_from: int | None, salary_to: int | None) -> list[float]:
+    """
+    1 inside the asked range, falls off with the relative distance outside of it
+    """
+    scores = []
+    for salary in salaries:
+        if salary is None or not (salary_from or salary_to):
+            scores.append(UNKNOWN_SCORE)
+        elif salary_from and salary < salary_from:
+            scores.append(salary / salary_from)
+        elif salary_to and salary > salary_to:
+            scores.append(max(0.0, 1 - (salary - salary_to) / salary_to))
+        else:
+            scores.append(1.0)
+    return scores
+
+
+def recency_scores(updated_ats: list[str | None]) -> list[float]:
+    now = datetime.now()
+    scores = []
+    for updated_at in updated_ats:
+        try:
+            updated = datetime.fromisoformat(updated_at).replace(tzinfo=None)
+        except (TypeError, ValueError):
+            scores.append(UNKNOWN_SCORE)
+            continue
+        scores.append(math.exp(-max(0.0, (now - updated).days) / RECENCY_DAYS))
+    return scores
+
+
+def rank_resumes(resume_cards: list[Resume], filters: dict, limit: int | None = None) -> list[Resume]:
+    """
+    Scores every card against the filters and returns them best first, only the best `limit` if it is given.
+    Features are computed column by column over all cards, a top `limit` is picked with a heap
+    instead of sorting all cards
+    """
+    if len(resume_cards) <= 1:
+        return resume_cards[:limit]
+    columns = ResumeBatch.from_resumes(resume_cards).columns
+    count = len(resume_cards)
+    feature_scores = {
+        "position": position_scores(columns["candidate_occupation"], filters.get("job_position")),
+        "experience": experience_scores(columns["details"], filters.get("work_experience")),
+        "salary": salary_scores([parse_salary(salary) for salary in columns["candidate_salary"]],
+                                filters.get("salary_from"), filters.get("salary_to")),
+        "recency": recency_scores(columns["updated_at"]),
+        "site_order": [1 - position / count for position in range(count)],
+    }
+    scores = [0.0] * count
+    for feature, weight in RANKING_WEIGHTS.items():
+        scores = [score + weight * feature_score for score, feature_score in zip(scores, feature_scores[feature])]
+    if limit is None or limit >= count:
+        best = sorted(range(count), key=scores.__getitem__, reverse=True)
+    else:
+        best = heapq.nlargest(limit, range(count), key=scores.__getitem__)
+    return [resume_cards[position] for position in best]
@@ -0,0 +1,101 @@
+import json
+import sys
+from dataclasses import dataclass, fields
+
+
+@dataclass(slots=True)
+class Resume:
+    """
+    Resume card found by a scraper, the same for every site
+    """
+    link: str
+    candidate_name: str | None = None
+    candidate_occupation: str | None = None
+    candidate_age: str | None = None
+    candidate_city: str | None = None
+    candidate_salary: str | None = None
+    updated_at: str | None = None
+    details: dict | None = None
+
+    def __post_init__(self) -> None:
+        # thousands of cards share a handful of cities and occupations, keep one copy of each
+        if self.candidate_city:
+            self.candidate_city = sys.intern(self.candidate_city)
+        if self.candidate_occupation:
+            self.candidate_occupation = sys.intern(self.candidate_occupation)
+
+    def as_row(self) -> list:
+        return [getattr(self, name) for name in RESUME_FIELDS]
+
+    @classmethod
+    def from_row(cls, row: list) -> "Resume":
+        return cls(*row)
+
+    @classmethod
+    def from_record(cls, record: dict, link_field: str = "href") -> "Resume | None":
+        """
+        Builds a resume from extracted card fields, None if the card has no link
+        """
+        link = record.get(link_field)
+        if not link:
+            return None
+        return cls(link, **{name: value for name, value in record.items() if name in RESUME_FIELDS and name != "link"})
+
+
+RESUME_FIELDS = tuple(field.name for field in fields(Resume))
+
+
+def dump_resumes(resumes) -> str:
+    """
+    JSON lines, one row of field values per resume, field names are written once in the first line
+    """
+    lines = [json.dumps(RESUME_FIELDS)]
+    lines.extend(json.dumps(resume.as_row(), ensure_ascii=False) for resume in resumes)
+    return "\n".join(lines)
+
+
+def load_resumes(text: str) -> list["Resume"]:
+    header, *lines = text.split("\n")
+    names = json.loads(header)
+    if tuple(names) == RESUME_FIELDS:
+        return [Resume.from_row(json.loads(line)) for line in lines]
+    # written by another version, only fields known to both are kept
+    return [Resume(**{name: value for name, value in zip(names, json.loads(line)) if name in RESUME_FIELDS})
+            for line in lines]
+
+
+class ResumeBatch:
+    """
+    Column per field instead of an object per resume, for scoring or storing large result sets
+    """
+
+    __slots__ = ("columns",)
+
+    def __init__(self, columns: dict[str, list]) -> None:
+        self.columns = columns
+
+    @classmethod
+    def from_resumes(cls, resumes) -> "ResumeBatch":
+        columns = {name: [] for name in RESUME_FIELDS}
+        for resume in resumes:
+            for name in RESUME_FIELDS:
+                columns[name].append(getattr(resume, name))
+        return cls(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns["link"])
+
+    def __getitem__(self, position: int) -> Resume:
+        return Resume(*(self.columns[name][position] for name in RESUME_FIELDS))
+
+    def __iter__(self):
+        return map(Resume, *(self.columns[name] for name in RESUME_FIELDS))
+
+    def to_json(self) -> str:
+        return json.dumps(self.columns, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, text: str) -> "ResumeBatch":
+        columns = json.loads(text)
+        size = len(columns["link"])
+        return cls({name: columns.get(name) or [None] * size for name in RESUME_FIELDS})
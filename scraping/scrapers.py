@@ -1,53 +1,163 @@
 import asyncio
+import functools
+import math
 import os
-import time
+from contextlib import aclosing, asynccontextmanager
+from urllib.parse import urlencode
 
 from dotenv import load_dotenv
 from selenium import webdriver
-from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.common.exceptions import WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.edge.options import Options as EdgeOptions
 from selenium.webdriver.edge.service import Service as EdgeService
 from selenium.webdriver.remote.webelement import WebElement
 from webdriver_manager.microsoft import EdgeChromiumDriverManager
 
+from scraping.extraction import extract_cards, records_to_resumes
+from scraping.governor import site_governors
 from scraping.locators import work_ua_locators
+from scraping.metrics import metrics
+from scraping.records import Resume
+from scraping.url_builder import WorkUaSearchUrlBuilder
+from scraping.utils import iter_pages_concurrently, parse_resumes_found_counter
 
 load_dotenv()
 
+# result pages are fetched concurrently, these limit a single search
+PAGE_CONCURRENCY = int(os.getenv("PAGE_CONCURRENCY", 5))
+PAGE_RETRIES = int(os.getenv("PAGE_RETRIES", 2))
+PAGE_TIMEOUT = float(os.getenv("PAGE_TIMEOUT", 20))
+# "lean" or "full", see BaseResumeScraper.init_driver
+BROWSER_PROFILE = os.getenv("BROWSER_PROFILE", "lean")
+# cap of the javascript heap of every page of the lean profile in megabytes, 0 keeps the browser's default
+BROWSER_MEMORY_MB = int(os.getenv("BROWSER_MEMORY_MB", 256))
+LEAN_BROWSER_ARGUMENTS = (
+    "--blink-settings=imagesEnabled=false",
+    "--disable-extensions",
+    "--disable-background-networking",
+    "--disable-component-update",
+    "--disable-default-apps",
+    "--disable-sync",
+    "--mute-audio",
+    "--no-first-run",
+)
+LEAN_BLOCKED_URLS = (
+    # images and media
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.svg", "*.ico", "*.mp4", "*.webm",
+    # fonts and styles, cards are found by selectors, not by how they look
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.css",
+    # analytics and ads
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*connect.facebook.net*",
+    "*hotjar.com*", "*mc.yandex.*", "*analytics*.js",
+)
+
+
+@functools.cache
+def edge_driver_path() -> str:
+    """
+    Path of msedgedriver, resolved once per process instead of asking the driver manager on every browser start
+    """
+    return os.getenv("EDGE_DRIVER_PATH") or EdgeChromiumDriverManager().install()
+
+
+def partial_results_warning(failed_pages: list[int]) -> str:
+    pages = ", ".join(str(page) for page in failed_pages)
+    return f"Some result pages could not be loaded ({pages}), results may be incomplete"
+
+
+def prefetch_window(limit: int | None, cards_per_page: int) -> int:
+    """
+    Number of next result pages fetched at once by a card stream, no more than `limit` cards need
+    """
+    if limit is None or not cards_per_page:
+        return PAGE_CONCURRENCY
+    return max(1, min(PAGE_CONCURRENCY, math.ceil((limit - cards_per_page) / cards_per_page)))
+
+
+@asynccontextmanager
+async def no_spare_drivers(max_count: int):
+    yield []
+
+
+def results_dict(resume_cards: list[Resume], warnings: list[str], failed_pages: list[int]) -> dict:
+    """
+    All cards of a search in the format returned by parse_resumes of the scrapers
+    """
+    resumes = {"resume_cards": resume_cards, "total_resumes": len(resume_cards)}
+    if warnings:
+        resumes["city_error_warning"] = " ".join(warnings)
+    if failed_pages:
+        resumes["partial_results_warning"] = partial_results_warning(failed_pages)
+    return resumes
+
 
 class BaseResumeScraper:
     """
     Base class for resume scrappers
     """
-    def __init__(self, base_url: str) -> None:
+    def __init__(self, base_url: str, driver=None) -> None:
         self.base_url = base_url
-        self.driver = self.init_driver()
+        # drivers leased from the pool are owned and closed by the pool
+        self.owns_driver = driver is None
+        self.driver = driver or self.init_driver()
 
     @staticmethod
-    def init_driver():
+    def init_driver(profile: str = BROWSER_PROFILE):
         """
-        Driver initialization method, currently uses only Edge browser
+        Driver initialization method, currently uses only Edge browser.
+        "lean" profile doesn't load images, media, fonts, styles and analytics, and returns from page loads
+        as soon as the html is parsed, "full" one loads pages like a regular browser
         """
         edge_options = EdgeOptions()
         edge_options.add_argument("--headless")  # Enable headless mode
         edge_options.add_argument("--disable-gpu")  # Sometimes required for headless mode
-
-        # Add Edge service for better compatibility
-        service = EdgeService(executable_path=EdgeChromiumDriverManager().install())
-        driver = webdriver.Edge(service=service, options=edge_options)
+        lean = profile == "lean"
+        if lean:
+            # scrapers read the DOM only, nothing has to be rendered or run in the background
+            edge_options.page_load_strategy = "eager"
+            edge_options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.managed_default_content_settings.media_stream": 2,
+            })
+            for argument in LEAN_BROWSER_ARGUMENTS:
+                edge_options.add_argument(argument)
+            if BROWSER_MEMORY_MB:
+                edge_options.add_argument(f"--js-flags=--max-old-space-size={BROWSER_MEMORY_MB}")
+
+        with metrics.span("driver_startup", profile=profile):
+            # Add Edge service for better compatibility
+            service = EdgeService(executable_path=edge_driver_path())
+            driver = webdriver.Edge(service=service, options=edge_options)
+            driver.set_page_load_timeout(PAGE_TIMEOUT)
+            if lean:
+                # requests are dropped by the browser before they are sent, pages still have their html and scripts
+                driver.execute_cdp_cmd("Network.enable", {})
+                driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": list(LEAN_BLOCKED_URLS)})
 
         return driver
 
-    async def fetch_html(self, url: str) -> str | None:
+    async def fetch_html(self, url: str, driver=None) -> str | None:
         """
-        Method to get html code of the page
+        Method to get html code of the page, uses scraper's driver unless another one is given.
+        Returns None if the page can't be loaded, raises CircuitOpenError while the site is down
         """
+        driver = driver or self.driver
         loop = asyncio.get_running_loop()
+
+        async def load():
+            metrics.increment("webdriver_calls_total", 2)
+            with metrics.span("page_load", engine="selenium"):
+                await loop.run_in_executor(None, lambda: driver.get(url=url))
+            return await loop.run_in_executor(None, lambda: driver.page_source)
+
         try:
-            await loop.run_in_executor(None, lambda: self.driver.get(url=url))
-            return self.driver.page_source
+            # the browser shares the site's request budget with the http engines
+            html = await site_governors.for_url(url).call(load)
+            metrics.increment("pages_fetched_total", engine="selenium")
+            return html
         except WebDriverException as error:
+            metrics.increment("page_fetch_failures_total", engine="selenium")
             print(f"An error occurred while trying to fetch the HTML from {url}: {error}")
             return None
 
@@ -58,28 +168,38 @@ class BaseResumeScraper:
         raise NotImplementedError
 
     async def close_driver(self):
-        if self.driver:
+        if self.driver and self.owns_driver:
             loop = asyncio.get_running_loop()
             await loop.run_in_executor(None, self.driver.quit)
 
     @staticmethod
     async def find_element_async(driver, locator, loop) -> WebElement:
+        metrics.increment("webdriver_calls_total")
         return await loop.run_in_executor(None, lambda: driver.find_element(*locator))
 
     @staticmethod
     async def find_elements_async(driver, locator, loop) -> list[WebElement]:
+        metrics.increment("webdriver_calls_total")
         return await loop.run_in_executor(None, lambda: driver.find_elements(*locator))
 
     @staticmethod
     async def send_keys_async(driver, keys, loop) -> None:
+        metrics.increment("webdriver_calls_total")
         await loop.run_in_executor(None, lambda: driver.send_keys(keys))
 
+    @staticmethod
+    async def execute_script_async(driver, script, loop, *args):
+        metrics.increment("webdriver_calls_total")
+        return await loop.run_in_executor(None, lambda: driver.execute_script(script, *args))
+
 
 class WorkUaScraper(BaseResumeScraper):
     """
     Resume scrapper for work.ua
     """
 
+    site_name = "work.ua"
+
     work_experience = {
         "Without experience": 0,
         "Up to 1 year": 1,
@@ -110,108 +230,192 @@ class WorkUaScraper(BaseResumeScraper):
         100000: 17,
     }
 
-    def __init__(self):
-        super().__init__(os.getenv("WORK_UA_BASE_URL"))
+    def __init__(self, driver=None, spare_drivers=None):
+        super().__init__(os.getenv("WORK_UA_BASE_URL"), driver=driver)
+        # `spare_drivers(max_count)` leases idle sessions to load next result pages in parallel
+        self.spare_drivers = spare_drivers or no_spare_drivers
+        self.url_builder = WorkUaSearchUrlBuilder(self.base_url, self.filter_query_params)
+        self.warnings = []
+        self.failed_pages = []
+        self.search_url = None
+        self.first_page_source = ""
+        self.first_page_card_count = 0
+        self.current_page = 0
+        self.total_pages = 1
+
+    async def navigate_to_results(self, filters: dict):
+        """
+        Opens filtered search results with a single navigation when the city is known,
+        the home page form is used only for cities missing in the local table
+        """
+        search_url = self.url_builder.build(filters)
+        if search_url is not None:
+            with metrics.span("open_search_url", site=self.site_name):
+                if await self.fetch_html(search_url) is not None:
+                    return
+        metrics.increment("form_fallbacks_total", site=self.site_name)
+        await self.find_resumes_without_filters(filters=filters)
+        await self.apply_filters(filters=filters)
 
     async def find_resumes_without_filters(self, filters: dict):
         """
         Method that takes different filters, such as job position, location, experience,
         and applies it for search
         """
-        await self.fetch_html(self.base_url)
-        loop = asyncio.get_running_loop()
+        with metrics.span("form_submit", site=self.site_name):
+            await self.fetch_html(self.base_url)
+            loop = asyncio.get_running_loop()
 
-        job_position = filters.get("job_position")
-        if job_position:
-            job_title_field = await self.find_element_async(self.driver,
-                                                            work_ua_locators.JOB_TITLE_INPUT_FIELD,
-                                                            loop)
-            await self.send_keys_async(job_title_field, job_position, loop)
-
-        location = filters.get("location")
-        if location:
-            location_field = await self.find_element_async(self.driver,
-                                                           work_ua_locators.LOCATION_INPUT_FIELD,
-                                                           loop)
-            self.driver.execute_script("arguments[0].value = '';", location_field)
-            await self.send_keys_async(location_field, location, loop)
-        await self.find_and_click_element(work_ua_locators.SUBMIT_BUTTON)
+            job_position = filters.get("job_position")
+            if job_position:
+                job_title_field = await self.find_element_async(self.driver,
+                                                                work_ua_locators.JOB_TITLE_INPUT_FIELD,
+                                                                loop)
+                await self.send_keys_async(job_title_field, job_position, loop)
+
+            location = filters.get("location")
+            if location:
+                location_field = await self.find_element_async(self.driver,
+                                                               work_ua_locators.LOCATION_INPUT_FIELD,
+                                                               loop)
+                await self.execute_script_async(self.driver, "arguments[0].value = '';", loop, location_field)
+                await self.send_keys_async(location_field, location, loop)
+            await self.find_and_click_element(work_ua_locators.SUBMIT_BUTTON)
+
+    async def extract_resume_cards(self, driver) -> list[Resume]:
+        records = await extract_cards(driver, work_ua_locators.RESUME_CARD, work_ua_locators.RESUME_CARD_FIELDS)
+        return records_to_resumes(records)
+
+    async def find_total_pages(self, loop) -> int:
+        # checking for pagination
+        pagination = await self.find_elements_async(self.driver, work_ua_locators.RESUME_PAGINATION, loop)
+        total_pages = 1
+
+        if pagination:
+            # if pagination exists, we need to find total number of pages
+            page_numbers = await self.find_elements_async(pagination[0], work_ua_locators.PAGINATION_LINKS, loop)
+            if page_numbers:
+                total_pages = int(await loop.run_in_executor(None, lambda: page_numbers[-2].text))
+        return total_pages
+
+    async def check_location(self, loop) -> str | None:
+        """
+        Returns warning if the site didn't recognize the city and searches in the whole country
+        """
+        location = await self.find_element_async(self.driver, work_ua_locators.LOCATION_INPUT_FIELD, loop)
+        location_value = await loop.run_in_executor(None, lambda: location.get_property("value"))
+        if location_value in ["Вся Україна", "All Ukraine", "Вся Украина", ]:
+            return ("Search is carried out throughout Ukraine, "
+                    "if you wanted to search for resumes in a specific city, "
+                    "check if you spelled ones name correctly")
+        return None
+
+    page_url = staticmethod(WorkUaSearchUrlBuilder.page_url)
+
+    async def iter_resume_cards(self, limit: int | None = None):
+        """
+        Yields resume cards page by page. Next pages are loaded only when the caller asks for more cards,
+        a window of them at once on the scraper's driver and spare ones, enough for `limit` cards
+        """
+        loop = asyncio.get_running_loop()
+        self.current_page = 1
+        self.total_pages = await self.find_total_pages(loop)
+        self.search_url = await loop.run_in_executor(None, lambda: self.driver.current_url)
+        self.first_page_source = await loop.run_in_executor(None, lambda: self.driver.page_source)
+        city_error_warning = await self.check_location(loop)
+        if city_error_warning:
+            self.warnings.append(city_error_warning)
+
+        resume_cards = await self.extract_resume_cards(self.driver)
+        self.first_page_card_count = len(resume_cards)
+        for resume_card in resume_cards:
+            yield resume_card
+        if self.total_pages == 1:
+            return
+
+        window = prefetch_window(limit, self.first_page_card_count)
+        async with self.spare_drivers(window - 1) as extra_drivers:
+            free_drivers = asyncio.Queue()
+            for driver in (self.driver, *extra_drivers):
+                free_drivers.put_nowait(driver)
+
+            async def fetch_resume_cards(page):
+                driver = await free_drivers.get()
+                try:
+                    if await self.fetch_html(self.page_url(self.search_url, page), driver=driver) is None:
+                        return None
+                    return await self.extract_resume_cards(driver)
+                finally:
+                    free_drivers.put_nowait(driver)
+
+            # page load timeout of the drivers bounds every attempt, so a driver is never shared by two pages
+            pages = iter_pages_concurrently(fetch_resume_cards, range(2, self.total_pages + 1), window, PAGE_RETRIES)
+            async with aclosing(pages):
+                async for window_pages, resume_cards, failed_pages in pages:
+                    self.current_page = window_pages[-1]
+                    self.failed_pages.extend(failed_pages)
+                    for resume_card in resume_cards:
+                        yield resume_card
+
+    async def count_resumes(self) -> int:
+        """
+        Reads total from the site's counter, or derives it from the last page instead of walking all pages.
+        Must be called after iter_resume_cards has loaded the first page
+        """
+        total_resumes = parse_resumes_found_counter(self.first_page_source, work_ua_locators.RESUMES_FOUND_PATTERN)
+        if total_resumes is not None:
+            return total_resumes
+        if self.total_pages == 1:
+            return self.first_page_card_count
+        if await self.fetch_html(self.page_url(self.search_url, self.total_pages)) is None:
+            return self.first_page_card_count * self.total_pages  # estimate, last page may be shorter
+        loop = asyncio.get_running_loop()
+        last_page_cards = await self.find_elements_async(self.driver, work_ua_locators.RESUME_CARD, loop)
+        return self.first_page_card_count * (self.total_pages - 1) + len(last_page_cards)
 
     async def parse_resumes(self):
-        try:
-            loop = asyncio.get_running_loop()
-            # checking for pagination
-            pagination = await self.find_elements_async(self.driver, work_ua_locators.RESUME_PAGINATION, loop)
-            total_pages = 1
-
-            if pagination:
-                # if pagination exists, we need to find total number of pages
-                page_numbers = await self.find_elements_async(pagination[0], (By.CSS_SELECTOR, "li a"), loop)
-                if page_numbers:
-                    total_pages = int(page_numbers[-2].text)
-
-            current_page = self.driver.current_url
-            all_resume_cards = []
-            for page in range(1, total_pages + 1):
-                if page > 1:
-                    page_query_parameter = f"page={page}"
-                    next_page_url = (f"{current_page}&{page_query_parameter}"
-                                     if "?" in current_page
-                                     else f"{current_page}?{page_query_parameter}")
-                    await self.fetch_html(next_page_url)
-
-                resume_cards = await self.find_elements_async(self.driver, work_ua_locators.RESUME_CARD, loop)
-                users_data = []
-                for resume in resume_cards:
-                    link = await self.find_element_async(resume, (By.CSS_SELECTOR, "h2.cut-top a"), loop)
-                    candidate_name = await self.find_element_async(resume,
-                                                                   (By.CSS_SELECTOR,
-                                                                    "p.add-top-xs.cut-bottom > span.strong-600"),
-                                                                   loop)
-                    users_data.append({
-                        link.get_attribute("href"): {
-                            "candidate_occupation": link.text,
-                            "candidate_name": candidate_name.text,
-                        }
-                    })
-                all_resume_cards.extend(users_data)
-            location = await self.find_element_async(self.driver, work_ua_locators.LOCATION_INPUT_FIELD, loop)
-            resumes = {"resume_cards": all_resume_cards, "total_resumes": len(all_resume_cards)}
-
-            if location.get_property("value") in ["Вся Україна", "All Ukraine", "Вся Украина", ]:
-                resumes.update({"city_error_warning": ("Search is carried out throughout Ukraine, "
-                                                       "if you wanted to search for resumes in a specific city, "
-                                                       "check if you spelled ones name correctly")})
-            return resumes
-
-        except TimeoutException:
-            return "Can't find any resumes with this search"
+        """
+        Collects resume cards from every result page of the opened search
+        """
+        resume_cards = [resume_card async for resume_card in self.iter_resume_cards()]
+        return results_dict(resume_cards, self.warnings, self.failed_pages)
         # TODO: add check if there are not any resumes from the search
 
-    async def apply_filters(self, filters: dict):
-        # wait for the list of filters to appear
-        url_with_filters = self.driver.current_url + "?"
+    @classmethod
+    def filter_query_params(cls, filters: dict) -> dict:
+        """
+        Maps filters chosen in the bot to work.ua query parameters
+        """
+        query_params = {}
+        # options unknown to work.ua (e.g. chosen for another site) are skipped
         work_experience = filters.get("work_experience")
         employment_type = filters.get("employment_type")
         salary_from = filters.get("salary_from")
         salary_to = filters.get("salary_to")
-        # apply filters if they are set
-        if work_experience:
-            url_with_filters += f"&experience={self.work_experience.get(work_experience)}"
-        if employment_type:
-            url_with_filters += f"&employment={self.employment_type.get(employment_type)}"
-        if salary_from:
-            url_with_filters += f"&salaryfrom={self.salaries.get(salary_from)}"
-        if salary_to:
-            url_with_filters += f"&salaryto={self.salaries.get(salary_to)}"
-        self.driver.get(url=url_with_filters)
+        if work_experience in cls.work_experience:
+            query_params["experience"] = cls.work_experience.get(work_experience)
+        if employment_type in cls.employment_type:
+            query_params["employment"] = cls.employment_type.get(employment_type)
+        if salary_from in cls.salaries:
+            query_params["salaryfrom"] = cls.salaries.get(salary_from)
+        if salary_to in cls.salaries:
+            query_params["salaryto"] = cls.salaries.get(salary_to)
+        return query_params
+
+    async def apply_filters(self, filters: dict):
+        with metrics.span("apply_filters", site=self.site_name):
+            loop = asyncio.get_running_loop()
+            current_url = await loop.run_in_executor(None, lambda: self.driver.current_url)
+            separator = "&" if "?" in current_url else "?"
+            url_with_filters = current_url + separator + urlencode(self.filter_query_params(filters))
+            await self.fetch_html(url_with_filters)
 
     async def find_and_click_checkbox(self, option_type, option_value, selector_template):
         if option_value:
             value = getattr(self, option_type).get(option_value)
             css_selector = selector_template.format(value=value)
             await self.find_and_click_element((By.CSS_SELECTOR, css_selector))
-            time.sleep(0.5)
+            await asyncio.sleep(0.5)
 
     # async def find_option_in_selector_and_choose(self, locator, value):
     #     try:
@@ -224,22 +428,5 @@ class WorkUaScraper(BaseResumeScraper):
     async def find_and_click_element(self, locator: tuple[str, str]):
         loop = asyncio.get_running_loop()
         element = await self.find_element_async(self.driver, locator, loop)
-        if element.is_enabled():
+        if await loop.run_in_executor(None, element.is_enabled):
             await loop.run_in_executor(None, element.click)
-
-
-class RobotaUaScraper(BaseResumeScraper):
-    """
-    Resume scrapper for robota.ua
-    """
-    def __init__(self):
-        super().__init__(os.getenv("ROBOTA_UA_BASE_URL"))
-        self.categories = {}
-
-    def parse_resumes(self):
-        # TODO: implement method
-        pass
-
-    def search_resumes(self):
-        # TODO: implement method
-        pass
@@ -0,0 +1,45 @@
+from urllib.parse import quote_plus, urlencode, urljoin, urlsplit
+
+from scraping.cities import find_work_ua_city_slug
+
+
+class WorkUaSearchUrlBuilder:
+    """
+    Builds final work.ua search urls straight from the filters,
+    e.g. https://www.work.ua/resumes-kyiv-python+developer/?experience=165&salaryfrom=5
+    """
+
+    def __init__(self, base_url: str, filter_query_params) -> None:
+        """
+        :param base_url: any url of the site, only scheme and host are used
+        :param filter_query_params: function mapping filters to query parameters
+        """
+        split_url = urlsplit(base_url)
+        self.site_url = f"{split_url.scheme}://{split_url.netloc}"
+        self.filter_query_params = filter_query_params
+
+    def build(self, filters: dict) -> str | None:
+        """
+        Returns search url, or None if the city is not in the local table and the site has to resolve it
+        """
+        city_slug = find_work_ua_city_slug(filters.get("location"))
+        if city_slug is None:
+            return None
+
+        path_parts = ["resumes"]
+        if city_slug:
+            path_parts.append(city_slug)
+        job_position = " ".join((filters.get("job_position") or "").lower().split())
+        if job_position:
+            path_parts.append(quote_plus(job_position, safe=""))
+        url = urljoin(self.site_url, "-".join(path_parts) + "/")
+
+        query_params = self.filter_query_params(filters)
+        return f"{url}?{urlencode(query_params)}" if query_params else url
+
+    @staticmethod
+    def page_url(url: str, page: int) -> str:
+        if page == 1:
+            return url
+        page_query_parameter = f"page={page}"
+        return f"{url}&{page_query_parameter}" if "?" in url else f"{url}?{page_query_parameter}"
@@ -1,3 +1,13 @@
+import asyncio
+import logging
+import re
+
+from scraping.governor import CircuitOpenError
+from scraping.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
 def determine_job_experience_options(exp: str, options: dict = None) -> list:
     """
     Returns list of options for experience range
@@ -30,3 +40,72 @@ def determine_job_experience_options(exp: str, options: dict = None) -> list:
         return list(set([options.get(year) for year in exp_range]))
     else:
         return [options.get(int(start_exp)), ]
+
+
+async def fetch_pages_concurrently(fetch_page, pages, concurrency: int, retries: int = 0,
+                                   page_timeout: float | None = None) -> tuple[list, list[int]]:
+    """
+    Runs `fetch_page(page)` for every page with at most `concurrency` pages in flight.
+    Failed pages are retried `retries` times, results are merged in page order.
+    Returns merged results and the list of pages that could not be fetched
+    :param fetch_page: coroutine function that returns list of items or raises/returns None on failure
+    :param pages: iterable of page numbers
+    :param concurrency: max number of pages fetched at once
+    :param retries: how many times to retry a failed page
+    :param page_timeout: seconds for a single attempt, None to rely on fetch_page's own timeout
+    """
+    semaphore = asyncio.Semaphore(max(concurrency, 1))
+
+    async def fetch_with_retries(page):
+        async with semaphore:
+            for attempt in range(retries + 1):
+                try:
+                    items = await asyncio.wait_for(fetch_page(page), page_timeout)
+                except CircuitOpenError:
+                    # the site is down, retrying only waits for the same answer
+                    break
+                except Exception as error:  # noqa: B902 any failure of a single page must not break the search
+                    logger.warning("Page %s failed on attempt %s: %r", page, attempt + 1, error)
+                    items = None
+                if items is not None:
+                    return page, items
+                if attempt < retries:
+                    metrics.increment("page_retries_total")
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+            metrics.increment("page_failures_total")
+            return page, None
+
+    results = await asyncio.gather(*(fetch_with_retries(page) for page in pages))
+
+    merged, failed_pages = [], []
+    for page, items in sorted(results, key=lambda result: result[0]):
+        if items is None:
+            failed_pages.append(page)
+        else:
+            merged.extend(items)
+    return merged, failed_pages
+
+
+async def iter_pages_concurrently(fetch_page, pages, window: int, retries: int = 0,
+                                  page_timeout: float | None = None):
+    """
+    Lazy version of fetch_pages_concurrently, fetches `window` pages at once and yields
+    (pages, merged results, failed pages) of every window. Next window is fetched only when the caller asks for it
+    """
+    pages = list(pages)
+    for start in range(0, len(pages), max(window, 1)):
+        window_pages = pages[start:start + max(window, 1)]
+        items, failed_pages = await fetch_pages_concurrently(fetch_page, window_pages, len(window_pages), retries,
+                                                             page_timeout)
+        yield window_pages, items, failed_pages
+
+
+def parse_resumes_found_counter(text: str, pattern: str) -> int | None:
+    """
+    Extracts total number of found resumes from the site's own counter, None if there is no counter
+    """
+    match = re.search(pattern, text, flags=re.IGNORECASE)
+    if not match:
+        return None
+    digits = re.sub(r"\D", "", match.group(1))
+    return int(digits) if digits else None
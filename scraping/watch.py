@@ -0,0 +1,245 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+
+from dotenv import load_dotenv
+
+from scraping.governor import SiteUnavailableError
+from scraping.main import open_search
+from scraping.metrics import metrics
+from scraping.records import Resume
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# results are newest first, so after this many already seen cards in a row the rest was seen too
+SEEN_STREAK_TO_STOP = 3
+# seconds between checks of the scheduler for searches that are due
+WATCH_POLL_INTERVAL = 60
+
+
+def url_hash(url: str) -> int:
+    """
+    Signed 64-bit hash of the resume link, the index keeps 8 bytes per resume instead of the whole url
+    """
+    return int.from_bytes(hashlib.blake2b(url.encode("utf-8"), digest_size=8).digest(), "big", signed=True)
+
+
+@dataclass
+class SavedSearch:
+    search_id: int
+    user_id: int
+    chat_id: int
+    sites: list[str]
+    filters: dict
+    created_at: float
+    last_checked_at: float | None = None
+
+
+class WatchStore:
+    """
+    Saved searches and hashes of resume links already reported for them
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._database: sqlite3.Connection | None = None
+        # scheduler and bot handlers use the store from different threads
+        self._lock = threading.Lock()
+
+    @property
+    def _connection(self) -> sqlite3.Connection:
+        # opened on first use under the lock, importing the module doesn't create the file
+        if self._database is None:
+            self._database = sqlite3.connect(self.path, check_same_thread=False)
+            self._database.executescript(
+                "CREATE TABLE IF NOT EXISTS saved_searches ("
+                "search_id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, chat_id INTEGER NOT NULL, "
+                "sites TEXT NOT NULL, filters TEXT NOT NULL, created_at REAL NOT NULL, last_checked_at REAL);"
+                "CREATE INDEX IF NOT EXISTS saved_searches_user ON saved_searches (user_id);"
+                "CREATE TABLE IF NOT EXISTS seen_resumes ("
+                "search_id INTEGER NOT NULL, url_hash INTEGER NOT NULL, PRIMARY KEY (search_id, url_hash)"
+                ") WITHOUT ROWID;"
+            )
+        return self._database
+
+    @staticmethod
+    def row_to_search(row: tuple) -> SavedSearch:
+        search_id, user_id, chat_id, sites, filters, created_at, last_checked_at = row
+        return SavedSearch(search_id, user_id, chat_id, json.loads(sites), json.loads(filters), created_at,
+                           last_checked_at)
+
+    def add_search(self, user_id: int, chat_id: int, sites: list[str], filters: dict) -> SavedSearch:
+        created_at = time.time()
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO saved_searches (user_id, chat_id, sites, filters, created_at) VALUES (?, ?, ?, ?, ?)",
+                (user_id, chat_id, json.dumps(sites), json.dumps(filters, ensure_ascii=False), created_at),
+            )
+        return SavedSearch(cursor.lastrowid, user_id, chat_id, sites, filters, created_at)
+
+    def list_searches(self, user_id: int) -> list[SavedSearch]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM saved_searches WHERE user_id = ? ORDER BY search_id", (user_id,)
+            ).fetchall()
+        return [self.row_to_search(row) for row in rows]
+
+    def delete_search(self, search_id: int, user_id: int) -> bool:
+        with self._lock, self._connection:
+            deleted = self._connection.execute(
+                "DELETE FROM saved_searches WHERE search_id = ? AND user_id = ?", (search_id, user_id)
+            ).rowcount
+            if deleted:
+                self._connection.execute("DELETE FROM seen_resumes WHERE search_id = ?", (search_id,))
+        return bool(deleted)
+
+    def due_searches(self, interval: float) -> list[SavedSearch]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT * FROM saved_searches WHERE last_checked_at IS NULL OR last_checked_at < ?",
+                (time.time() - interval,),
+            ).fetchall()
+        return [self.row_to_search(row) for row in rows]
+
+    def claim_search(self, search_id: int, interval: float) -> bool:
+        """
+        Marks a due search as being checked, False if another bot process has just taken it
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "UPDATE saved_searches SET last_checked_at = ? "
+                "WHERE search_id = ? AND (last_checked_at IS NULL OR last_checked_at < ?)",
+                (now, search_id, now - interval),
+            ).rowcount > 0
+
+    def mark_checked(self, search_id: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE saved_searches SET last_checked_at = ? WHERE search_id = ?", (time.time(), search_id)
+            )
+
+    def is_seen(self, search_id: int, url: str) -> bool:
+        with self._lock:
+            return self._connection.execute(
+                "SELECT 1 FROM seen_resumes WHERE search_id = ? AND url_hash = ?", (search_id, url_hash(url))
+            ).fetchone() is not None
+
+    def add_seen(self, search_id: int, urls: list[str]) -> None:
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO seen_resumes (search_id, url_hash) VALUES (?, ?)",
+                [(search_id, url_hash(url)) for url in urls],
+            )
+
+
+async def find_new_resumes(store: WatchStore, saved_search: SavedSearch, parser_class, max_new: int) -> list[Resume]:
+    """
+    Pages through the site's results only until it reaches cards reported before, remembers the new ones.
+    The first check of a search only remembers what is there already
+    """
+    first_check = saved_search.last_checked_at is None
+    new_cards, seen_streak = [], 0
+    async with open_search(parser_class, saved_search.filters) as parser:
+        # the check stops after `max_new` new cards or a streak of seen ones, no more pages are prefetched
+        async with aclosing(parser.iter_resume_cards(max_new + SEEN_STREAK_TO_STOP)) as resume_stream:
+            async for resume_card in resume_stream:
+                if await asyncio.to_thread(store.is_seen, saved_search.search_id, resume_card.link):
+                    seen_streak += 1
+                    if seen_streak >= SEEN_STREAK_TO_STOP:
+                        break
+                    continue
+                seen_streak = 0
+                new_cards.append(resume_card)
+                if len(new_cards) >= max_new:
+                    break
+    await asyncio.to_thread(store.add_seen, saved_search.search_id,
+                            [resume_card.link for resume_card in new_cards])
+    return [] if first_check else new_cards
+
+
+class WatchScheduler:
+    """
+    Periodically re-runs saved searches and passes new resumes to `notify(saved_search, resume_cards)`
+    """
+
+    def __init__(self, store: WatchStore, interval: float, concurrency: int, max_new: int) -> None:
+        self.store = store
+        self.interval = interval
+        self.max_new = max_new
+        self.parser_classes: dict = {}
+        self.notify = None
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._task: asyncio.Task | None = None
+
+    async def start(self, parser_classes: dict, notify) -> None:
+        self.parser_classes = parser_classes
+        self.notify = notify
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                due_searches = await asyncio.to_thread(self.store.due_searches, self.interval)
+                results = await asyncio.gather(*(self.check(saved_search) for saved_search in due_searches),
+                                               return_exceptions=True)
+                for saved_search, result in zip(due_searches, results):
+                    if isinstance(result, Exception):
+                        logger.error("Saved search %s check failed", saved_search.search_id, exc_info=result)
+            except Exception:  # noqa: B902 the scheduler serves every user, it must outlive any failure
+                logger.exception("Saved search checks failed, retrying in %s seconds", WATCH_POLL_INTERVAL)
+            await asyncio.sleep(WATCH_POLL_INTERVAL)
+
+    async def check(self, saved_search: SavedSearch) -> None:
+        new_cards = []
+        async with self._semaphore:
+            if not await asyncio.to_thread(self.store.claim_search, saved_search.search_id, self.interval):
+                return
+            for site in saved_search.sites:
+                parser_class = self.parser_classes.get(site)
+                if parser_class is None:
+                    continue
+                try:
+                    with metrics.span("watch_check", site=site):
+                        new_cards += await find_new_resumes(self.store, saved_search, parser_class,
+                                                            self.max_new - len(new_cards))
+                except SiteUnavailableError:
+                    continue
+                except Exception as error:  # noqa: B902 one broken check shouldn't stop the scheduler
+                    logger.warning("Saved search %s check on %s failed: %r", saved_search.search_id, site, error)
+                    continue
+                if len(new_cards) >= self.max_new:
+                    break
+            await asyncio.to_thread(self.store.mark_checked, saved_search.search_id)
+
+        metrics.increment("watch_new_resumes_total", len(new_cards))
+        if new_cards and self.notify:
+            try:
+                await self.notify(saved_search, new_cards)
+            except Exception:  # noqa: B902 e.g. the user blocked the bot, other searches are still reported
+                logger.exception("Could not report new resumes of saved search %s", saved_search.search_id)
+
+
+watch_store = WatchStore(os.getenv("WATCH_DB_PATH", "watches.db"))
+watch_scheduler = WatchScheduler(
+    watch_store,
+    interval=float(os.getenv("WATCH_INTERVAL", 3 * 60 * 60)),
+    concurrency=int(os.getenv("WATCH_CONCURRENCY", 2)),
+    max_new=int(os.getenv("WATCH_MAX_NEW_RESUMES", 20)),
+)
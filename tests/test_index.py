@@ -0,0 +1,56 @@
+import pytest
+
+from scraping.index import ResumeIndex
+from scraping.records import Resume
+
+
+@pytest.fixture
+def index(tmp_path):
+    return ResumeIndex(str(tmp_path / "resume_index.db"), max_age=3600, keep_for=3600)
+
+
+def add_exhaustive_search(index, job_position, occupations):
+    resume_cards = [
+        Resume(link=f"https://example.com/{number}", candidate_occupation=occupation)
+        for number, occupation in enumerate(occupations)
+    ]
+    index.add("work.ua", {"job_position": job_position}, resume_cards, len(resume_cards), exhaustive=True)
+
+
+def test_narrower_search_is_answered_from_broader_one(index):
+    add_exhaustive_search(index, "Python", ["Python Django developer", "Python Flask developer"])
+
+    resume_cards, total_resumes = index.search("work.ua", {"job_position": "python django"}, limit=10)
+
+    assert [resume_card.candidate_occupation for resume_card in resume_cards] == ["Python Django developer"]
+    assert total_resumes == 1
+
+
+@pytest.mark.parametrize("job_position", ["C#", ".NET C#", "C++ Qt", "C developer", "c"])
+def test_searches_with_symbols_are_not_answered_by_other_ones(index, job_position):
+    add_exhaustive_search(index, "C++", ["C++ developer", "C# developer", "C developer"])
+
+    assert index.search("work.ua", {"job_position": job_position}, limit=10) is None
+
+
+def test_same_search_with_symbols_is_answered(index):
+    add_exhaustive_search(index, "C++", ["C++ developer"])
+
+    resume_cards, total_resumes = index.search("work.ua", {"job_position": "c++"}, limit=10)
+
+    assert [resume_card.candidate_occupation for resume_card in resume_cards] == ["C++ developer"]
+    assert total_resumes == 1
+
+
+def test_searches_stored_before_symbols_were_kept_are_dropped(tmp_path):
+    path = str(tmp_path / "resume_index.db")
+    index = ResumeIndex(path, max_age=3600, keep_for=3600)
+    add_exhaustive_search(index, "C++", ["C++ developer", "C developer"])
+    # older versions stored "C++" as "c"
+    index._connection.execute("UPDATE indexed_searches SET position = 'c'")
+    index._connection.execute("PRAGMA user_version = 0")
+    index._connection.commit()
+
+    reopened_index = ResumeIndex(path, max_age=3600, keep_for=3600)
+
+    assert reopened_index.search("work.ua", {"job_position": "c developer"}, limit=10) is None